@@ -3,6 +3,8 @@ import pandas as pd
 import json
 import plotly.express as px
 import plotly.graph_objects as go
+import numpy as np
+from src.artifacts import load_array, minmax_downsample
 
 # --- Dashboard Configuration ---
 st.set_page_config(
@@ -12,22 +14,42 @@ st.set_page_config(
 )
 
 # --- Data Loading (with error handling) ---
-@st.cache_data
-def load_data():
-    """Loads all necessary data files."""
-    data = {}
+# Each section loads only its own artifacts, when it is shown
+def _load(reader, path):
     try:
-        data['exec_summary'] = pd.read_csv('data/executive_summary.csv')
-        data['seq_results'] = pd.read_csv('data/sequential_results.csv')
-        data['uplift_results'] = pd.read_csv('data/uplift_results.csv')
-        with open('data/bandits_report.json') as f:
-            data['bandits_data'] = json.load(f)
+        return reader(path)
     except FileNotFoundError as e:
         st.error(f"Error: Missing data file. Please ensure '{e.filename}' exists in the 'data/' folder.")
         st.stop()
-    return data
 
-data = load_data()
+@st.cache_data
+def load_exec_summary():
+    return _load(pd.read_csv, 'data/executive_summary.csv')
+
+@st.cache_data
+def load_seq_results():
+    return _load(pd.read_csv, 'data/sequential_results.csv')
+
+@st.cache_data
+def load_uplift_results():
+    return _load(pd.read_csv, 'data/uplift_results.csv')
+
+@st.cache_data
+def load_bandits_report():
+    def read_json(path):
+        with open(path) as f:
+            return json.load(f)
+    return _load(read_json, 'data/bandits_report.json')
+
+@st.cache_data
+def load_reward_trace(policy, n_points):
+    """Cumulative reward of one policy, min/max-downsampled to about n_points points."""
+    report = load_bandits_report()
+    if 'traces' in report:
+        trace = np.cumsum(_load(lambda path: load_array(path, f'{policy}/rewards'), report['traces']).astype(np.float64))
+    else:
+        trace = np.asarray(report['results'][policy]['reward_trace'])  # reports written with --artifact_format json
+    return minmax_downsample(trace, n_points // 2)
 
 # --- Title and Introduction ---
 st.title("Checkout Optimizer: A/B Test & Bandits Dashboard")
@@ -40,128 +62,148 @@ st.markdown(
 )
 
 # --- Main Dashboard Sections ---
+SECTIONS = ["1. Executive Summary", "2. Sequential Monitoring", "3. Heterogeneous Treatment Effects",
+            "4. Multi-Armed Bandit Simulation"]
+section = st.sidebar.radio("Section", SECTIONS)
+plot_points = st.sidebar.number_input("Plot resolution (points)", min_value=100, max_value=10000, value=1000, step=100,
+                                      help="Long series are reduced to the min and max of each bucket, so spikes stay visible.")
 
-# --- 1. Executive Summary & Key Metrics ---
-st.header("1. Executive Summary")
-
-# Extract key metrics for st.metric display
-exec_df = data['exec_summary'].set_index('Metric')
-lift_cuped = exec_df.loc['Lift (CUPED)']['Value']
-p_lift_gt_0 = exec_df.loc['P(lift>0)']['Value']
-stop_look = exec_df.loc['Sequential stop look']['Value']
-
-col1, col2, col3 = st.columns(3)
-with col1:
-    st.metric(
-        label="CUPED Lift on GPV",
-        value=f"{lift_cuped:.2f}%",
-        delta=f"{lift_cuped:.2f}% (Significant)" if p_lift_gt_0 > 0.95 else None,
-        delta_color="normal"
-    )
-with col2:
-    st.metric(
-        label="Probability of Lift > 0",
-        value=f"{p_lift_gt_0:.2%}",
-        help="Bayesian probability that the treatment is better than control."
-    )
-with col3:
-    st.metric(
-        label="Experiment Stopped",
-        value=f"Day {int(stop_look)}",
-        help="The day the sequential analysis indicated a conclusive result."
-    )
+def _exec_metrics():
+    exec_df = load_exec_summary().set_index('Metric')
+    return exec_df, exec_df.loc['Lift (CUPED)']['Value'], exec_df.loc['P(lift>0)']['Value'], exec_df.loc['Sequential stop look']['Value']
 
-st.dataframe(exec_df.T, use_container_width=True)
+# --- 1. Executive Summary & Key Metrics ---
+def show_executive_summary():
+    st.header("1. Executive Summary")
+
+    # Extract key metrics for st.metric display
+    exec_df, lift_cuped, p_lift_gt_0, stop_look = _exec_metrics()
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric(
+            label="CUPED Lift on GPV",
+            value=f"{lift_cuped:.2f}%",
+            delta=f"{lift_cuped:.2f}% (Significant)" if p_lift_gt_0 > 0.95 else None,
+            delta_color="normal"
+        )
+    with col2:
+        st.metric(
+            label="Probability of Lift > 0",
+            value=f"{p_lift_gt_0:.2%}",
+            help="Bayesian probability that the treatment is better than control."
+        )
+    with col3:
+        st.metric(
+            label="Experiment Stopped",
+            value=f"Day {int(stop_look)}",
+            help="The day the sequential analysis indicated a conclusive result."
+        )
+
+    st.dataframe(exec_df.T, use_container_width=True)
 
 # --- 2. Sequential Monitoring ---
-st.header("2. Sequential Monitoring")
-st.markdown(
-    """
-    This chart shows the daily lift and its statistical significance boundary. The experiment could
-    be safely stopped as soon as the blue line (p-value) crosses below the orange line (alpha boundary).
-    """
-)
+def show_sequential_monitoring():
+    st.header("2. Sequential Monitoring")
+    st.markdown(
+        """
+        This chart shows the daily lift and its statistical significance boundary. The experiment could
+        be safely stopped as soon as the blue line (p-value) crosses below the orange line (alpha boundary).
+        """
+    )
 
-seq_df = data['seq_results']
-fig_seq = px.line(seq_df, x='look', y=['p', 'alpha_boundary'],
-                  labels={'value': 'P-Value', 'variable': 'Metric', 'look': 'Day'},
-                  title="Sequential P-Value vs. O'Brien-Fleming Boundary")
-fig_seq.add_vline(x=stop_look, line_dash="dash", line_color="green", annotation_text="Stopping Point", annotation_position="bottom")
-fig_seq.update_traces(hovertemplate='Day: %{x}<br>P-Value: %{y:.4f}<extra></extra>', selector=dict(name='p'))
-fig_seq.update_traces(hovertemplate='Day: %{x}<br>Boundary: %{y:.4f}<extra></extra>', selector=dict(name='alpha_boundary'))
-st.plotly_chart(fig_seq, use_container_width=True)
+    seq_df = load_seq_results()
+    _, _, _, stop_look = _exec_metrics()
+    fig_seq = px.line(seq_df, x='look', y=['p', 'alpha_boundary'],
+                      labels={'value': 'P-Value', 'variable': 'Metric', 'look': 'Day'},
+                      title="Sequential P-Value vs. O'Brien-Fleming Boundary")
+    fig_seq.add_vline(x=stop_look, line_dash="dash", line_color="green", annotation_text="Stopping Point", annotation_position="bottom")
+    fig_seq.update_traces(hovertemplate='Day: %{x}<br>P-Value: %{y:.4f}<extra></extra>', selector=dict(name='p'))
+    fig_seq.update_traces(hovertemplate='Day: %{x}<br>Boundary: %{y:.4f}<extra></extra>', selector=dict(name='alpha_boundary'))
+    st.plotly_chart(fig_seq, use_container_width=True)
 
 # --- 3. Heterogeneous Treatment Effects (Uplift) ---
-st.header("3. Heterogeneous Treatment Effects")
-st.markdown(
-    """
-    The distribution of the Conditional Average Treatment Effect (CATE) shows how the feature impacted 
-    individual users differently. A positive CATE indicates a user who responded well to the treatment.
-    """
-)
-uplift_df = data['uplift_results']
-uplift_learners = ['cate_t', 'cate_x']
-selected_learners = st.multiselect(
-    "Select Uplift Learner(s)",
-    options=uplift_learners,
-    default=uplift_learners
-)
-
-if selected_learners:
-    fig_uplift = go.Figure()
-    for learner in selected_learners:
-        fig_uplift.add_trace(go.Histogram(
-            x=uplift_df[learner],
-            name=f"Distribution of {learner.replace('cate_', '').upper()}-Learner CATE",
-            opacity=0.7,
-            xbins=dict(start=uplift_df[learner].min(), end=uplift_df[learner].max(), size=(uplift_df[learner].max() - uplift_df[learner].min()) / 50)
-        ))
-    fig_uplift.update_layout(
-        title="Distribution of Conditional Average Treatment Effect (CATE)",
-        xaxis_title="CATE (User-Level GPV Lift)",
-        yaxis_title="Number of Users",
-        barmode='overlay',
-        legend_title="Learner"
+def show_uplift():
+    st.header("3. Heterogeneous Treatment Effects")
+    st.markdown(
+        """
+        The distribution of the Conditional Average Treatment Effect (CATE) shows how the feature impacted 
+        individual users differently. A positive CATE indicates a user who responded well to the treatment.
+        """
     )
-    st.plotly_chart(fig_uplift, use_container_width=True)
+    uplift_df = load_uplift_results()
+    uplift_learners = [c for c in ['cate_t', 'cate_x', 'cate_s', 'cate_dr'] if c in uplift_df.columns]
+    selected_learners = st.multiselect(
+        "Select Uplift Learner(s)",
+        options=uplift_learners,
+        default=uplift_learners
+    )
+
+    if selected_learners:
+        fig_uplift = go.Figure()
+        for learner in selected_learners:
+            fig_uplift.add_trace(go.Histogram(
+                x=uplift_df[learner],
+                name=f"Distribution of {learner.replace('cate_', '').upper()}-Learner CATE",
+                opacity=0.7,
+                xbins=dict(start=uplift_df[learner].min(), end=uplift_df[learner].max(), size=(uplift_df[learner].max() - uplift_df[learner].min()) / 50)
+            ))
+        fig_uplift.update_layout(
+            title="Distribution of Conditional Average Treatment Effect (CATE)",
+            xaxis_title="CATE (User-Level GPV Lift)",
+            yaxis_title="Number of Users",
+            barmode='overlay',
+            legend_title="Learner"
+        )
+        st.plotly_chart(fig_uplift, use_container_width=True)
 
 # --- 4. Multi-Armed Bandit Simulation ---
-st.header("4. Multi-Armed Bandit Simulation")
-st.markdown(
-    """
-    This section compares different bandit policies (Thompson Sampling, UCB1, Epsilon-Greedy)
-    on their ability to find the best-performing arm (treatment).
-    """
-)
-bandits_data = data['bandits_data']
+def show_bandits():
+    st.header("4. Multi-Armed Bandit Simulation")
+    st.markdown(
+        """
+        This section compares different bandit policies (Thompson Sampling, UCB1, Epsilon-Greedy)
+        on their ability to find the best-performing arm (treatment).
+        """
+    )
+    bandits_data = load_bandits_report()
 
-# Create columns for the metrics and the chart
-bandit_col1, bandit_col2 = st.columns([1, 2])
+    # Create columns for the metrics and the chart
+    bandit_col1, bandit_col2 = st.columns([1, 2])
 
-with bandit_col1:
-    policy_options = list(bandits_data['results'].keys())
-    selected_policy = st.selectbox("Select Bandit Policy", policy_options, help="Choose a policy to view its performance.")
+    with bandit_col1:
+        policy_options = list(bandits_data['results'].keys())
+        selected_policy = st.selectbox("Select Bandit Policy", policy_options, help="Choose a policy to view its performance.")
     
-    res = bandits_data['results'][selected_policy]
+        res = bandits_data['results'][selected_policy]
     
-    st.metric(
-        label="Cumulative Reward",
-        value=f"${res['cumulative_reward']:.2f}",
-        help="The total reward accumulated by the policy over 1000 steps."
-    )
+        st.metric(
+            label="Cumulative Reward",
+            value=f"${res['cumulative_reward']:.2f}",
+            help="The total reward accumulated by the policy over the simulated horizon."
+        )
     
-    st.json({"Arm Allocation": {f"Arm {i}": alloc for i, alloc in enumerate(res['allocation'])}})
-    st.metric(
-        label="Probability of Correct Selection (PCS)",
-        value=f"{bandits_data['pcs'][selected_policy]:.2%}",
-        help="The probability of the policy identifying and exploiting the best arm."
-    )
-
-with bandit_col2:
-    fig_bandit = px.line(
-        x=list(range(len(res['reward_trace']))),
-        y=res['reward_trace'],
-        labels={'x': 'Steps', 'y': 'Cumulative Reward'},
-        title=f"Cumulative Reward Over Time for {selected_policy.replace('_', ' ').title()} Policy"
-    )
-    st.plotly_chart(fig_bandit, use_container_width=True)
+        st.json({"Arm Allocation": {f"Arm {i}": alloc for i, alloc in enumerate(res['allocation'])}})
+        st.metric(
+            label="Probability of Correct Selection (PCS)",
+            value=f"{bandits_data['pcs'][selected_policy]:.2%}",
+            help="The probability of the policy identifying and exploiting the best arm."
+        )
+
+    with bandit_col2:
+        steps, trace = load_reward_trace(selected_policy, plot_points)
+        fig_bandit = px.line(
+            x=steps,
+            y=trace,
+            labels={'x': 'Steps', 'y': 'Cumulative Reward'},
+            title=f"Cumulative Reward Over Time for {selected_policy.replace('_', ' ').title()} Policy"
+        )
+        st.plotly_chart(fig_bandit, use_container_width=True)
+
+# Only the selected section runs, so only its artifacts are read
+{
+    SECTIONS[0]: show_executive_summary,
+    SECTIONS[1]: show_sequential_monitoring,
+    SECTIONS[2]: show_uplift,
+    SECTIONS[3]: show_bandits,
+}[section]()
@@ -1,20 +1,28 @@
 # generate_data.py
 """
 Generate synthetic data for A/B testing pipeline:
-- users.csv
+- users table (data/users.csv, or Parquet/Feather with --format)
 """
 
+import argparse
 import numpy as np
 import pandas as pd
 import os
+from src.storage import write_table
 
-np.random.seed(42)
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument('--n_users', type=int, default=1000)
+parser.add_argument('--seed', type=int, default=42)
+parser.add_argument('--format', choices=['csv', 'parquet', 'feather'], default='csv', help="Output format for the users table.")
+args = parser.parse_args()
+
+np.random.seed(args.seed)
 
 # Create data directory if it doesn't exist
 os.makedirs('data', exist_ok=True)
 
 # Users table
-n_users = 1000
+n_users = args.n_users
 users = pd.DataFrame({
     'user_id': [f'u{i}' for i in range(n_users)],
     'country': np.random.choice(['US', 'IN', 'UK'], n_users),
@@ -22,12 +30,12 @@ users = pd.DataFrame({
     'traffic_source': np.random.choice(['organic','paid'], n_users),
     'past_7d_gpv': np.random.normal(100, 20, n_users)
 })
-users.to_csv('data/users.csv', index=False)
+write_table(users, 'users', fmt=args.format)
 
 # -----------------------------
 # Sessions, Events, Orders, Perf tables
 # These are generated as part of run_ab_test.py, this file will only
-# create the base users.csv file and let the next script handle the simulation.
+# create the base users table and let the next script handle the simulation.
 # -----------------------------
 
-print("Synthetic data generated successfully in 'data/' folder.")
\ No newline at end of file
+print("Synthetic data generated successfully in 'data/' folder.")
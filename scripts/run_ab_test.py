@@ -4,35 +4,50 @@ Simulate A/B test:
 1. Assign users to control/treatment (sticky, stratified)
 2. Simulate exposures/events/metrics
 3. Save processed tables for analysis
+
+With --format parquet, tables are streamed chunk by chunk into Parquet datasets
+under data/parquet/, partitioned by session_day and variant.
 """
 
+import argparse
 import pandas as pd
 import os
 from src.assign import assign_users
-from src.simulate import simulate_funnel
+from src.simulate import simulate_funnel, simulate_funnel_chunks
 from src.metrics import summarize_metrics
+from src.storage import read_table, write_table, write_funnel_dataset
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument('--format', choices=['csv', 'parquet', 'feather'], default='csv', help="Format for input users and output tables.")
+parser.add_argument('--chunk_size', type=int, default=100_000, help="Users simulated per chunk.")
+args = parser.parse_args()
 
 
 # Load users
-users = pd.read_csv('data/users.csv')
+users = read_table('users', fmt=args.format)
 # Assign users to variants
 variant_list = ['control','treatment']
 assignments = assign_users(users, exp_id='checkout_optimizer', variant_list=variant_list, strata_cols=['country','device'])
-assignments.to_csv('data/assignments.csv', index=False)
+write_table(assignments, 'assignments', fmt=args.format)
 
 
 # Merge user data with assignments before simulation
 users_with_assignments = users.merge(assignments, on='user_id', how='left')
 
 
-# Simulate sessions & events using corrected simulate.py
-sessions, events, orders, perf = simulate_funnel(users_with_assignments, lift=0.05)
-
+if args.format == 'parquet':
+    # Stream chunks straight to disk so no table is ever held in full
+    chunks = simulate_funnel_chunks(users_with_assignments, lift=0.05, chunk_size=args.chunk_size)
+    counts = write_funnel_dataset(chunks, 'data/parquet')
+    print("Rows written:", counts)
+else:
+    # Simulate sessions & events using corrected simulate.py
+    sessions, events, orders, perf = simulate_funnel(users_with_assignments, lift=0.05, chunk_size=args.chunk_size)
 
-# Save all tables
-sessions.to_csv('data/sessions.csv', index=False)
-events.to_csv('data/events.csv', index=False)
-orders.to_csv('data/orders.csv', index=False)
-perf.to_csv('data/perf.csv', index=False)
+    # Save all tables
+    write_table(sessions, 'sessions', fmt=args.format)
+    write_table(events, 'events', fmt=args.format)
+    write_table(orders, 'orders', fmt=args.format)
+    write_table(perf, 'perf', fmt=args.format)
 
-print("A/B test simulation complete. Tables saved in 'data/' folder.")
\ No newline at end of file
+print("A/B test simulation complete. Tables saved in 'data/' folder.")
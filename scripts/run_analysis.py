@@ -5,59 +5,122 @@ Full A/B Test Analysis Pipeline:
 2. Aggregate per-user GPV
 3. Apply CUPED
 4. Run frequentist analysis
-5. Run Bayesian posterior analysis
+5. Run Bayesian posterior analysis, overall and per segment
 6. Run sequential monitoring
 7. Estimate heterogeneity / uplift (CATE)
-8. Save results & executive summary
+8. Funnel conversion per variant and stratum
+9. Beta-Binomial posteriors of the conversion rate, overall and per segment
+10. Save results & executive summary
 """
 
+import argparse
 import pandas as pd
 import numpy as np
 import os
 from src.ab_testing import per_user_gpv, run_frequentist, run_bayesian
 from src.analyze import summarize_lift, cuped_transform
-from src.bayes import bayesian_lift_summary
+from src.bayes import bayesian_lift_summary, segment_lift_summary
 from src.sequential import sequential_monitoring
-from src.uplift import t_learner, x_learner, uplift_summary
-
-
-# Load data
-sessions = pd.read_csv('data/sessions.csv')
-orders = pd.read_csv('data/orders.csv')
-users = pd.read_csv('data/users.csv')
-assignments = pd.read_csv('data/assignments.csv')
-
-# Merge sessions with assignments
-sessions = sessions.merge(assignments[['user_id', 'variant']], on='user_id', how='left')
-
-# Aggregate per-user GPV
-df = per_user_gpv(sessions, orders, assignments)
-
-# Map past_7d_gpv from the users table
-df['past_7d_gpv'] = df['user_id'].map(users.set_index('user_id')['past_7d_gpv'])
-
-# Drop rows with NaNs in key columns
-df = df.dropna(subset=['gpv', 'past_7d_gpv', 'variant'])
+from src.uplift import UpliftEngine, cross_fit_cate, uplift_summary
+from src.storage import read_table, table_path
+from src.pipeline import Pipeline, StageCache
+from src.profiling import RunProfiler
+from src.bootstrap import bootstrap_cuped_lift
+from src.scoring import FeatureEncoder, UpliftModel
+from src.funnel import funnel_conversion
+from src.beta_binomial import conversion_counts, beta_binomial_report
+
+parser = argparse.ArgumentParser(description="Run the A/B test analysis pipeline.")
+parser.add_argument('--format', choices=['csv', 'parquet', 'feather'], default='csv', help="Format of the tables written by run_ab_test.py.")
+parser.add_argument('--n_boot', type=int, default=2000, help="Cluster bootstrap replicates for the CUPED lift CI (0 to skip).")
+parser.add_argument('--uplift_backend', choices=['gb', 'hist'], default='gb', help="Gradient boosting backend for the uplift base learners.")
+parser.add_argument('--n_folds', type=int, default=5, help="Cross-fitting folds for out-of-fold CATE on every user (0 to score a 30%% holdout only).")
+parser.add_argument('--chunk_size', type=int, default=5_000_000, help="Event rows streamed per chunk for the funnel.")
+parser.add_argument('--n_jobs', type=int, default=1, help="Parallel jobs for fitting the uplift base learners.")
+parser.add_argument('--no_shrinkage', action='store_true', help="Use the flat prior for segment posteriors instead of pooling across segments.")
+parser.add_argument('--seed', type=int, default=42, help="Seed for the simulated look days of sequential monitoring.")
+parser.add_argument('--cache_dir', default='data/stage_cache', help="Directory of cached stage artifacts.")
+parser.add_argument('--no_cache', action='store_true', help="Recompute every stage without reading or writing the cache.")
+parser.add_argument('--cache_max_mb', type=float, default=2048, help="Evict least recently used artifacts beyond this size.")
+parser.add_argument('--cache_max_age_days', type=float, default=30, help="Evict artifacts not used for this many days.")
+parser.add_argument('--profile', default='data/run_profile.json', help="Run profile output (.json, or .parquet without cProfile tables).")
+parser.add_argument('--cprofile', default='', help="Comma-separated stages to run under cProfile, or 'all'.")
+args = parser.parse_args()
+
+cache = None if args.no_cache else StageCache(args.cache_dir, max_bytes=int(args.cache_max_mb * 2**20),
+                                               max_age=args.cache_max_age_days * 86400)
+profiler = RunProfiler(cprofile='all' if args.cprofile == 'all' else [s for s in args.cprofile.split(',') if s],
+                       prof_dir=os.path.join(os.path.dirname(args.profile) or '.', 'profiles')).activate()
+pipe = Pipeline(cache, profiler)
+
+
+# Load data, decoding only the columns the analysis uses; one stage per table. Loads are
+# not cached (a pickle would duplicate each table) but their keys still track the files
+table_columns = {
+    'sessions': ['session_id', 'user_id'],
+    'orders': ['order_id', 'session_id', 'revenue', 'discount', 'var_cost'],
+    'users': None,
+    'assignments': ['user_id', 'variant', 'strata'],
+}
+for name, columns in table_columns.items():
+    pipe.run(f'load_{name}', read_table, outputs=[name], params={'name': name, 'fmt': args.format, 'columns': columns},
+             files=[table_path(name, fmt=args.format)], cache=False)
+users, assignments = pipe.artifacts['users'], pipe.artifacts['assignments']
+
+def user_table(sessions, orders, assignments, users):
+    # Aggregate per-user GPV (variant attached from assignments, ITT)
+    df = per_user_gpv(sessions, orders, assignments)
+    # Map past_7d_gpv from the users table
+    df['past_7d_gpv'] = df['user_id'].map(users.set_index('user_id')['past_7d_gpv'])
+    # Drop rows with NaNs in key columns
+    return df.dropna(subset=['gpv', 'past_7d_gpv', 'variant'])
+
+df = pipe.run('per_user_gpv', user_table, inputs=['sessions', 'orders', 'assignments', 'users'], outputs=['df'])
 
 # Frequentist CUPED analysis
-res_freq = run_frequentist(df)
-df_cuped = res_freq['df_cuped']
+def frequentist_stage(df):
+    res = run_frequentist(df)
+    return res, res['df_cuped']
+
+res_freq, df_cuped = pipe.run('frequentist', frequentist_stage, inputs=['df'], outputs=['res_freq', 'df_cuped'])
 print("Frequentist CUPED-adjusted lift:")
 print(res_freq)
 
+# Cluster bootstrap CI for the CUPED lift (GPV is heavy-tailed)
+boot_res = None
+if args.n_boot > 0:
+    boot_res = pipe.run('bootstrap', bootstrap_cuped_lift, inputs=['df'], outputs=['boot_res'], params={'n_boot': args.n_boot})
+    print("Bootstrap CUPED lift CI (BCa):", boot_res['ci_low_bca'], boot_res['ci_high_bca'])
+
 # Bayesian posterior
-bayes_res = run_bayesian(df_cuped)
+bayes_res = pipe.run('bayesian', run_bayesian, inputs=['df_cuped'], outputs=['bayes_res'])
 print("Bayesian posterior:")
 print(bayes_res)
 
-# Sequential monitoring
-# To make this runnable, we need to add a 'day' column to the dataframe
-df_cuped['day'] = pd.to_datetime('2025-01-01') + pd.to_timedelta(np.random.randint(1, 15, size=len(df_cuped)), unit='D')
-df_cuped['day'] = df_cuped['day'].dt.date
-df_cuped = df_cuped.sort_values('day')
+# Bayesian posteriors per country x device x traffic_source segment, from grouped sufficient statistics
+def segment_bayes_stage(df_cuped, users, shrinkage):
+    segment_cols = ['country', 'device', 'traffic_source']
+    df_seg = df_cuped.merge(users[['user_id'] + segment_cols], on='user_id', how='left')
+    return segment_lift_summary(df_seg, ['gpv', 'gpv_cuped'], segment_cols, shrinkage=shrinkage)
+
+segment_res = pipe.run('segment_bayesian', segment_bayes_stage, inputs=['df_cuped', 'users'], outputs=['segment_res'],
+                       params={'shrinkage': not args.no_shrinkage})
+segment_res.to_csv('data/segment_posteriors.csv', index=False)
+print("Segment posteriors (CUPED GPV), lowest P(lift>0):")
+print(segment_res[segment_res['metric'] == 'gpv_cuped'].nsmallest(5, 'p_lift_gt_0').to_string(index=False))
 
-# Run sequential monitoring
-seq_res = sequential_monitoring(df_cuped, outcome_col='gpv_cuped', treat_col='variant', cluster_col='user_id', max_looks=10)
+# Sequential monitoring
+def sequential_stage(df_cuped, seed, max_looks):
+    # To make this runnable, we need to add a 'day' column to the dataframe
+    df_seq = df_cuped.copy()
+    rng = np.random.RandomState(seed)
+    df_seq['day'] = pd.to_datetime('2025-01-01') + pd.to_timedelta(rng.randint(1, 15, size=len(df_seq)), unit='D')
+    df_seq['day'] = df_seq['day'].dt.date
+    df_seq = df_seq.sort_values('day')
+    return sequential_monitoring(df_seq, outcome_col='gpv_cuped', treat_col='variant', cluster_col='user_id', max_looks=max_looks)
+
+seq_res = pipe.run('sequential', sequential_stage, inputs=['df_cuped'], outputs=['seq_res'],
+                   params={'seed': args.seed, 'max_looks': 10})
 seq_res.to_csv('data/sequential_results.csv', index=False)
 print("Sequential monitoring stop flags:")
 print(seq_res[['look', 'lift', 'se', 'stop']])
@@ -71,26 +134,50 @@ else:
 
 
 # Heterogeneity / uplift (CATE)
-# Merge in user features for uplift modeling
-df_cuped = df_cuped.merge(users[['user_id', 'country', 'device', 'traffic_source']], on='user_id', how='left')
-features = ['past_7d_gpv', 'country', 'device', 'traffic_source']
-df_uplift = df_cuped.dropna(subset=features)
-df_uplift['treat'] = df_uplift['variant'].map({'control':0, 'treatment':1})
-
-# One-hot encode categorical features before calling uplift models
-categorical_features = ['country', 'device', 'traffic_source']
-df_uplift = pd.get_dummies(df_uplift, columns=categorical_features, drop_first=True)
-encoded_features = [col for col in df_uplift.columns if any(cat in col for cat in categorical_features)]
-all_features = ['past_7d_gpv'] + encoded_features
-
-# Pass the dataframe and column names to the corrected functions
-t_learner_res = t_learner(df_uplift, outcome_col='gpv_cuped', treat_col='treat', feature_cols=all_features)
-x_learner_res = x_learner(df_uplift, outcome_col='gpv_cuped', treat_col='treat', feature_cols=all_features)
-
-uplift_results = x_learner_res.copy()
-uplift_results.rename(columns={'cate':'cate_x'}, inplace=True)
-uplift_results['cate_t'] = t_learner_res['cate']
+def uplift_stage(df_cuped, users, n_folds, backend, n_jobs):
+    # Merge in user features for uplift modeling
+    df_cuped = df_cuped.merge(users[['user_id', 'country', 'device', 'traffic_source']], on='user_id', how='left')
+    features = ['past_7d_gpv', 'country', 'device', 'traffic_source']
+    df_uplift = df_cuped.dropna(subset=features)
+    df_uplift['treat'] = df_uplift['variant'].map({'control':0, 'treatment':1})
+
+    # One-hot encode categorical features with a fixed encoder that is saved with the model
+    categorical_features = ['country', 'device', 'traffic_source']
+    encoder = FeatureEncoder(['past_7d_gpv'], categorical_features).fit(df_uplift)
+    all_features = encoder.feature_names
+    df_uplift_raw = df_uplift
+    df_uplift = pd.concat([df_uplift.drop(columns=encoder.input_cols), encoder.transform_frame(df_uplift)], axis=1)
+
+    if n_folds > 1:
+        # Out-of-fold CATE for every user
+        uplift_results = cross_fit_cate(df_uplift, outcome_col='gpv_cuped', treat_col='treat', feature_cols=all_features,
+                                        n_folds=n_folds, backend=backend, n_jobs=n_jobs)
+        t_learner_res = uplift_results[['user_id', 'cate_t']].rename(columns={'cate_t': 'cate'})
+        x_learner_res = uplift_results[['user_id', 'cate_x']].rename(columns={'cate_x': 'cate'})
+    else:
+        # One engine fits each base learner once and shares its predictions across meta-learners
+        engine = UpliftEngine(df_uplift, outcome_col='gpv_cuped', treat_col='treat', feature_cols=all_features,
+                              backend=backend, n_jobs=n_jobs)
+        engine.fit(['control', 'treatment', 'propensity', 'single'])
+        t_learner_res = engine.t_learner()
+        x_learner_res = engine.x_learner()
+
+        uplift_results = x_learner_res.copy()
+        uplift_results.rename(columns={'cate':'cate_x'}, inplace=True)
+        uplift_results['cate_t'] = t_learner_res['cate']
+        uplift_results['cate_s'] = engine.s_learner()['cate']
+        uplift_results['cate_dr'] = engine.dr_learner()['cate']
+
+    # X-learner fitted on all users for batch scoring (scripts/score_users.py)
+    uplift_model = UpliftModel(encoder, learner='x', backend=backend)
+    uplift_model.fit(df_uplift_raw, outcome_col='gpv_cuped', treat_col='treat', n_jobs=n_jobs)
+    return uplift_results, t_learner_res, x_learner_res, uplift_model
+
+uplift_results, t_learner_res, x_learner_res, uplift_model = pipe.run(
+    'uplift', uplift_stage, inputs=['df_cuped', 'users'], outputs=['uplift_results', 't_learner_res', 'x_learner_res', 'uplift_model'],
+    params={'n_folds': args.n_folds, 'backend': args.uplift_backend, 'n_jobs': args.n_jobs})
 uplift_results.to_csv('data/uplift_results.csv', index=False)
+uplift_model.save('data/uplift_model.joblib')
 
 print("T-Learner CATE summary:")
 print(uplift_summary(t_learner_res))
@@ -98,11 +185,50 @@ print("X-Learner CATE summary:")
 print(uplift_summary(x_learner_res))
 
 
+# Step-to-step funnel conversion, streaming the events table
+funnel = pipe.run('funnel', funnel_conversion, inputs=['assignments'], outputs=['funnel'],
+                  params={'fmt': args.format, 'chunk_size': args.chunk_size}, files=[table_path('events', fmt=args.format)])
+funnel.to_csv('data/funnel_results.csv', index=False)
+print("Funnel conversion by variant:")
+print(funnel.groupby(['variant', 'step_index', 'step'], observed=True)[['users_assigned', 'users_logged', 'users_reached_prefix']].sum()
+      .assign(prefix_rate=lambda d: d['users_reached_prefix'] / d['users_assigned']).to_string())
+
+# Closed-form Beta-Binomial posteriors of the conversion rate, overall and per segment
+def conversion_stage(assignments, users, fmt, chunk_size):
+    segment_cols = ['country', 'device', 'traffic_source']
+    counts = conversion_counts(assignments, segments=users, segment_cols=segment_cols, fmt=fmt, chunk_size=chunk_size)
+    overall = beta_binomial_report(counts.groupby('variant', as_index=False, observed=True)[['users', 'conversions']].sum())
+    return pd.concat([overall, beta_binomial_report(counts, segment_cols)], ignore_index=True)
+
+conversion_res = pipe.run('conversion_bayesian', conversion_stage, inputs=['assignments', 'users'], outputs=['conversion_res'],
+                          params={'fmt': args.format, 'chunk_size': args.chunk_size}, files=[table_path('events', fmt=args.format)])
+conversion_res.to_csv('data/conversion_posteriors.csv', index=False)
+conversion_overall = conversion_res[conversion_res['country'].isna()].set_index('variant')
+print("Conversion rate posteriors (Beta-Binomial):")
+print(conversion_overall[['users', 'conversions', 'posterior_mean', 'ci_low', 'ci_high', 'p_beats_control', 'expected_loss']])
+
 # Save executive summary
 exec_summary = pd.DataFrame({
-    'Metric': ['Lift (CUPED)', 'theta', 'Posterior mean lift', 'P(lift>0)', 'P(lift in ROPE)', 'Sequential stop look'],
-    'Value': [res_freq['lift'], res_freq['theta'], bayes_res['posterior_mu'], bayes_res['p_lift_greater_than_zero'], bayes_res['p_lift_in_rope'], stop_look]
+    'Metric': ['Lift (CUPED)', 'theta', 'Posterior mean lift', 'P(lift>0)', 'P(lift in ROPE)', 'Sequential stop look',
+               'P(conversion lift>0)'],
+    'Value': [res_freq['lift'], res_freq['theta'], bayes_res['posterior_mu'], bayes_res['p_lift_greater_than_zero'], bayes_res['p_lift_in_rope'], stop_look,
+              conversion_overall.loc['treatment', 'p_beats_control']]
 })
+if boot_res is not None:
+    exec_summary = pd.concat([exec_summary, pd.DataFrame({
+        'Metric': ['Lift CI low (bootstrap BCa)', 'Lift CI high (bootstrap BCa)'],
+        'Value': [boot_res['ci_low_bca'], boot_res['ci_high_bca']]
+    })], ignore_index=True)
 exec_summary.to_csv('data/executive_summary.csv', index=False)
 
+evicted = pipe.close()
+profiler.deactivate()
+profiler.write(args.profile)
+print(f"Run profile saved to '{args.profile}':")
+print(profiler.to_frame().query('depth == 0')[['stage', 'wall_s', 'cpu_s', 'peak_rss_mb', 'rows_in', 'rows_out']].to_string(index=False))
+print("Stage cache:")
+print(pipe.report().to_string(index=False))
+if evicted:
+    print(f"Evicted {len(evicted)} cached artifacts.")
+
 print("Analysis complete. Results saved in 'data/' folder.")
\ No newline at end of file
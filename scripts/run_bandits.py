@@ -1,70 +1,133 @@
 # scripts/run_bandits.py
 """
 Simulate Bandit policies and generate bandits_report.json
+
+Each policy is run once step by step (reward trace for the dashboard) and then
+replicated --replications times in lockstep to estimate PCS, regret and
+allocation with confidence intervals.
+
+Per-step series (rewards of the single run, Monte Carlo regret curves) are
+written as float32 arrays to data/bandits_traces.npz; the JSON report keeps
+the summaries. --artifact_format json embeds the series in the JSON instead.
 """
 
+import argparse
 import numpy as np
 import json
 import os
 from src.bandits import ThompsonBernoulli, ThompsonGaussian, UCB1, EpsilonGreedy
+from src.bandit_sim import simulate_bandit_replications
+from src.artifacts import save_arrays
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--horizon', type=int, default=1000, help="Steps per run.")
+    parser.add_argument('--n_arms', type=int, default=2, help="Number of arms; arm i has true GPV 100 + 5*i.")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--replications', type=int, default=1000, help="Monte Carlo replications per policy (0 to skip).")
+    parser.add_argument('--n_jobs', type=int, default=1, help="Worker processes for the replications.")
+    parser.add_argument('--artifact_format', choices=['npz', 'json'], default='npz', help="Where per-step series are stored.")
+    parser.add_argument('--no_compress', action='store_true', help="Write the .npz without compression.")
+    args = parser.parse_args()
 
-np.random.seed(42)
-
-
-# Define bandit policies
-policies = {
-    'epsilon_greedy': EpsilonGreedy(n_arms=2, epsilon=0.1),
-    'ucb1': UCB1(n_arms=2),
-    'thompson_sampling': ThompsonGaussian(n_arms=2, mu0=1.0, sigma0=1.0)
-}
-n_steps = 1000
-
-bandits_results = {'results': {}, 'pcs': {}}
-
-# True values for reward simulation
-true_gpv = [100, 105]
-best_arm = np.argmax(true_gpv)
-
-for policy_name, policy in policies.items():
-    cumulative_reward = 0
-    reward_trace = []
-    
-    # Simulate rewards for each step
-    for step in range(n_steps):
-        arm = policy.select_arm()
-        
-        # Simulate reward: arm 0 = control, arm 1 = treatment
-        reward = np.random.normal(true_gpv[arm], 0.1)
-        
-        # Update the policy with the observed reward
-        policy.update(arm, reward)
-        
-        cumulative_reward += reward
-        reward_trace.append(cumulative_reward)
-    
-    # Store results
-    bandits_results['results'][policy_name] = {
-        'cumulative_reward': round(cumulative_reward,2),
-        'allocation': policy.counts.astype(int).tolist() if hasattr(policy,'counts') else policy.n.astype(int).tolist(),
-        'reward_trace': reward_trace
+    np.random.seed(args.seed)
+
+
+    # Define bandit policies
+    policies = {
+        'epsilon_greedy': EpsilonGreedy(n_arms=args.n_arms, epsilon=0.1),
+        'ucb1': UCB1(n_arms=args.n_arms),
+        'thompson_sampling': ThompsonGaussian(n_arms=args.n_arms, mu0=1.0, sigma0=1.0)
     }
-    
-    # Correct PCS: check if the final most selected arm is the best arm
-    if hasattr(policy,'counts'):
-        chosen_arm = np.argmax(policy.counts)
-    else:
-        chosen_arm = np.argmax(policy.n)
-    
-    pcs = 1.0 if chosen_arm == best_arm else 0.0
-    bandits_results['pcs'][policy_name] = pcs
+    policy_params = {
+        'epsilon_greedy': {'epsilon': 0.1},
+        'ucb1': {},
+        'thompson_sampling': {'mu0': 1.0, 'sigma0': 1.0}
+    }
+    n_steps = args.horizon
+
+    bandits_results = {'results': {}, 'pcs': {}}
+    series = {}
+
+    # True values for reward simulation
+    true_gpv = [100 + 5 * i for i in range(args.n_arms)]
+    reward_sd = 0.1
+    best_arm = np.argmax(true_gpv)
+
+    for policy_name, policy in policies.items():
+        rewards = np.empty(n_steps)
+
+        # Simulate rewards for each step
+        for step in range(n_steps):
+            arm = policy.select_arm()
 
+            # Simulate reward: arm 0 = control, arm 1 = treatment
+            reward = np.random.normal(true_gpv[arm], reward_sd)
+
+            # Update the policy with the observed reward
+            policy.update(arm, reward)
+
+            rewards[step] = reward
+
+        # Store results
+        bandits_results['results'][policy_name] = {
+            'cumulative_reward': round(float(rewards.sum()),2),
+            'allocation': policy.counts.astype(int).tolist() if hasattr(policy,'counts') else policy.n.astype(int).tolist(),
+        }
+        series[f'{policy_name}/rewards'] = rewards
+
+        # Correct PCS: check if the final most selected arm is the best arm
+        if hasattr(policy,'counts'):
+            chosen_arm = np.argmax(policy.counts)
+        else:
+            chosen_arm = np.argmax(policy.n)
+
+        pcs = 1.0 if chosen_arm == best_arm else 0.0
+        bandits_results['pcs'][policy_name] = pcs
+
+
+    # Replication-level PCS, regret and allocation
+    if args.replications > 0:
+        bandits_results['monte_carlo'] = {}
+        for policy_name, params in policy_params.items():
+            mc = simulate_bandit_replications(policy_name, true_gpv, n_steps=n_steps, n_reps=args.replications,
+                                              reward_sd=reward_sd, seed=args.seed, n_jobs=args.n_jobs, **params)
+            bandits_results['monte_carlo'][policy_name] = {
+                'replications': mc['n_reps'],
+                'pcs': mc['pcs'],
+                'pcs_ci': list(mc['pcs_ci']),
+                'final_regret': mc['final_regret'],
+                'final_regret_ci': list(mc['final_regret_ci']),
+                'allocation_mean': mc['allocation_mean'].tolist(),
+                'allocation_ci_low': mc['allocation_ci_low'].tolist(),
+                'allocation_ci_high': mc['allocation_ci_high'].tolist(),
+            }
+            for key in ('regret_mean', 'regret_ci_low', 'regret_ci_high'):
+                series[f'{policy_name}/{key}'] = mc[key]
+            # Report the replication estimate rather than the single run's 0/1 outcome
+            bandits_results['pcs'][policy_name] = mc['pcs']
+
+
+    # Save per-step series, then the JSON report
+    os.makedirs('data', exist_ok=True)
+    if args.artifact_format == 'npz':
+        bandits_results['traces'] = save_arrays('data/bandits_traces.npz', series, {'n_steps': n_steps},
+                                                compress=not args.no_compress)
+    else:
+        for key, values in series.items():
+            policy_name, name = key.split('/')
+            if name == 'rewards':
+                bandits_results['results'][policy_name]['reward_trace'] = np.cumsum(values).tolist()
+            else:
+                bandits_results['monte_carlo'][policy_name][name] = values.tolist()
+    with open('data/bandits_report.json', 'w') as f:
+        json.dump(bandits_results, f, indent=4)
 
-# Save to JSON
-os.makedirs('data', exist_ok=True)
-with open('data/bandits_report.json', 'w') as f:
-    json.dump(bandits_results, f, indent=4)
+    print("Bandit simulation complete. Report saved to 'data/bandits_report.json'")
+    print("Probability of Correct Selection (PCS):")
+    for name, val in bandits_results['pcs'].items():
+        ci = bandits_results.get('monte_carlo', {}).get(name, {}).get('pcs_ci')
+        print(f"{name}: {val}" + (f" (95% CI {ci[0]:.3f}-{ci[1]:.3f})" if ci else ""))
 
-print("Bandit simulation complete. Report saved to 'data/bandits_report.json'")
-print("Probability of Correct Selection (PCS):")
-for name, val in bandits_results['pcs'].items():
-    print(f"{name}: {val}")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+# scripts/run_benchmarks.py
+"""
+Scaling benchmarks for the src/ hot paths (assign_users, simulate_funnel,
+per_user_gpv, diff_in_means_crse, sequential_monitoring, guardrails and the
+uplift learners) at 10^3 to 10^7 synthetic users.
+
+Each case and size runs in a fresh process; throughput (users/s) and peak
+RSS are appended to --results tagged with the git commit, then compared with
+the most recently run other commit (or --baseline) on the same host.
+"""
+
+import argparse
+import sys
+from src.benchmarks import CASES, SIZES, run_suite, append_results, load_results, compare
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cases', default=','.join(CASES), help="Comma-separated cases to run.")
+    parser.add_argument('--max_users', type=int, default=10**6, help="Largest size to run (up to 10^7).")
+    parser.add_argument('--repeats', type=int, default=3, help="Repeats per case for sizes up to 10^5 (best time is kept).")
+    parser.add_argument('--results', default='data/benchmarks.jsonl', help="Results history file.")
+    parser.add_argument('--baseline', default=None, help="Commit (prefix) to compare against.")
+    parser.add_argument('--threshold', type=float, default=0.2, help="Relative throughput drop or memory growth flagged as a regression.")
+    parser.add_argument('--fail_on_regression', action='store_true', help="Exit with status 1 if any regression is flagged.")
+    args = parser.parse_args()
+
+    history = load_results(args.results)
+    results = run_suite(args.cases.split(','), sizes=SIZES, repeats=args.repeats, max_users=args.max_users)
+    append_results(results, args.results)
+    print(f"Results appended to '{args.results}'")
+
+    report = compare(results, history, baseline=args.baseline, threshold=args.threshold)
+    if report.empty:
+        print("No baseline run on this host to compare against.")
+        return
+    print(f"Comparison with {report['baseline_commit'].iloc[0][:10]} (threshold {args.threshold:.0%}):")
+    print(report[['case', 'n_users', 'users_per_s', 'users_per_s_base', 'throughput_change', 'memory_change', 'regression']]
+          .to_string(index=False))
+    if report['regression'].any():
+        print(f"{int(report['regression'].sum())} regression(s) flagged.")
+        if args.fail_on_regression:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+# scripts/score_users.py
+"""
+Score every user with the uplift model saved by run_analysis.py.
+
+Users are streamed from disk in chunks, scored in batches (optionally on a
+process pool) and written to a Parquet file of user_id, cate.
+"""
+
+import argparse
+from src.scoring import score_users
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default='data/uplift_model.joblib', help="Model saved by UpliftModel.save.")
+    parser.add_argument('--format', choices=['csv', 'parquet', 'feather'], default='csv', help="Format of the users table.")
+    parser.add_argument('--out', default='data/uplift_scores.parquet', help="Output Parquet file.")
+    parser.add_argument('--chunk_size', type=int, default=500_000, help="Users decoded and scored per batch.")
+    parser.add_argument('--n_jobs', type=int, default=1, help="Worker processes for scoring.")
+    args = parser.parse_args()
+
+    n_rows = score_users(args.model, args.out, root='data', fmt=args.format, chunk_size=args.chunk_size, n_jobs=args.n_jobs)
+    print(f"Scored {n_rows} users. Scores saved to '{args.out}'")
+
+if __name__ == "__main__":
+    main()
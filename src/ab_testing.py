@@ -1,28 +1,59 @@
 # src/ab_testing.py
+import numpy as np
 import pandas as pd
+from scipy import sparse
+from statsmodels.stats.multitest import multipletests
 from src.metrics import compute_gpv
-from src.analyze import diff_in_means_crse, cuped_transform
+from src.analyze import diff_in_means_crse, cuped_transform, _crse_from_aggregates, _treat_indicator
 from src.bayes import posterior_diff_normal, prob_greater_than_zero, prob_in_rope
+from src.profiling import instrument
 
-def per_user_gpv(sessions: pd.DataFrame, orders: pd.DataFrame, assignments: pd.DataFrame):
+@instrument()
+def per_user_gpv(sessions: pd.DataFrame, orders: pd.DataFrame, assignments: pd.DataFrame = None):
     """
     Aggregate GPV per user.
+
+    User ids are factorized once and order GPV is summed per user with
+    bincount via a session -> user code lookup. The variant comes from
+    `assignments` (ITT) when given, otherwise from the user's first session.
+    Repeated identical assignment rows are collapsed; a user assigned to more
+    than one variant raises a ValueError.
     """
-    if orders.empty:
-        sessions = sessions.copy()
-        sessions['gpv'] = 0.0
-    
-    gpv = compute_gpv(orders).reset_index()
-    # Merge on user_id and then aggregate, as gpv is per session
-    sess = sessions.merge(gpv.rename(columns={'gpv':'session_gpv'}), left_on='session_id', right_on='session_id', how='left').fillna(0.0)
-    
-    # Merge with assignments to get the variant info
-    sess = sess.merge(assignments[['user_id', 'variant']], on='user_id', how='left')
-    
-    agg = sess.groupby(['user_id','variant'], as_index=False)['session_gpv'].sum()
-    agg.rename(columns={'session_gpv':'gpv'}, inplace=True)
+    user_codes, user_ids = pd.factorize(sessions['user_id'])
+    n_users = len(user_ids)
+
+    gpv = np.zeros(n_users)
+    if not orders.empty:
+        # Row of each order's session, then that session's user code
+        sess_idx = pd.Index(sessions['session_id']).get_indexer(orders['session_id'])
+        order_user = np.where(sess_idx >= 0, user_codes[sess_idx], -1)
+        matched = order_user >= 0
+        order_gpv = compute_gpv(orders).values
+        gpv = np.bincount(order_user[matched], weights=order_gpv[matched], minlength=n_users)
+
+    if assignments is not None:
+        assignments = assignments[['user_id', 'variant']]
+        if not assignments['user_id'].is_unique:
+            assignments = assignments.drop_duplicates()
+            conflicting = assignments['user_id'][assignments['user_id'].duplicated()].unique()
+            if len(conflicting):
+                raise ValueError(f"{len(conflicting)} user(s) assigned to more than one variant, "
+                                 f"e.g. {list(conflicting[:5])}.")
+        pos = pd.Index(assignments['user_id']).get_indexer(user_ids)
+        variant = assignments['variant'].take(np.where(pos >= 0, pos, 0)).values
+        has_variant = (pos >= 0) & pd.notna(variant)
+    else:
+        # Position of each user's first session
+        first = np.empty(n_users, dtype=np.int64)
+        valid = np.flatnonzero(user_codes >= 0)
+        first[user_codes[valid[::-1]]] = valid[::-1]
+        variant = sessions['variant'].take(first).values
+        has_variant = pd.notna(variant)
+
+    agg = pd.DataFrame({'user_id': user_ids[has_variant], 'variant': variant[has_variant], 'gpv': gpv[has_variant]})
     return agg
 
+@instrument()
 def run_frequentist(df: pd.DataFrame):
     """
     Frequentist ITT analysis with CUPED adjustment.
@@ -40,6 +71,57 @@ def run_frequentist(df: pd.DataFrame):
     res['df_cuped'] = df2 # Return the modified df to prevent re-computation
     return res
 
+@instrument()
+def run_frequentist_multi(df: pd.DataFrame, outcome_cols: list, covariate_cols: list = None,
+                          treat_col: str = 'variant', cluster_col: str = 'user_id', adjust: str = None):
+    """
+    Frequentist ITT analysis with CUPED adjustment for many metrics at once.
+
+    covariate_cols gives the pre-period covariate for each outcome (None for no
+    CUPED). Thetas, adjusted lifts and cluster-robust SEs are computed for all
+    outcomes with matrix operations over one cluster indicator. Rows with a
+    missing value in any used column are dropped. adjust is an optional
+    statsmodels multipletests method (e.g. 'holm', 'fdr_bh') applied across
+    metrics.
+
+    Returns one row per metric: metric, covariate, theta, lift, se, t, p,
+    ci_low, ci_high (and p_adj when adjust is set).
+    """
+    if covariate_cols is None:
+        covariate_cols = [None] * len(outcome_cols)
+    if len(covariate_cols) != len(outcome_cols):
+        raise ValueError("covariate_cols must have one entry per outcome column.")
+
+    used = list(dict.fromkeys(list(outcome_cols) + [c for c in covariate_cols if c is not None] + [treat_col, cluster_col]))
+    df2 = df[used].dropna()
+    Y = df2[outcome_cols].to_numpy(dtype=float)
+    X = np.column_stack([df2[c].to_numpy(dtype=float) if c is not None else np.zeros(len(df2)) for c in covariate_cols])
+
+    # CUPED theta per metric, as in cuped_transform (ddof=1, zero for a constant covariate)
+    n = len(df2)
+    Xc = X - X.mean(axis=0)
+    cov = (Xc * (Y - Y.mean(axis=0))).sum(axis=0) / (n - 1)
+    varx = (Xc ** 2).sum(axis=0) / (n - 1)
+    theta = np.where(varx > 1e-9, cov / np.where(varx > 1e-9, varx, 1.0), 0.0)
+    Y_cuped = Y - theta * X
+
+    # Per-cluster group sums for all metrics with one sparse cluster x row indicator
+    d = _treat_indicator(df2[treat_col])
+    codes, clusters = pd.factorize(df2[cluster_col])
+    C = sparse.csr_matrix((np.ones(n), (codes, np.arange(n))), shape=(len(clusters), n))
+    n1 = C @ d.astype(float)
+    n0 = C @ (~d).astype(float)
+    sum1 = C @ (Y_cuped * d[:, None])
+    sum0 = C @ (Y_cuped * ~d[:, None])
+
+    res = pd.DataFrame({'metric': list(outcome_cols), 'covariate': list(covariate_cols), 'theta': theta})
+    for key, val in _crse_from_aggregates(n0, sum0, n1, sum1).items():
+        res[key] = val
+    if adjust is not None:
+        res['p_adj'] = multipletests(res['p'].values, method=adjust)[1]
+    return res
+
+@instrument()
 def run_bayesian(df: pd.DataFrame):
     """
     Bayesian analysis on CUPED-adjusted outcomes.
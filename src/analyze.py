@@ -2,11 +2,98 @@
 import numpy as np
 import pandas as pd
 import statsmodels.api as sm
+from scipy.stats import norm
+from src.profiling import instrument
 
-def diff_in_means_crse(df: pd.DataFrame, y_col: str, treat_col: str, cluster_col: str):
+def _treat_indicator(treat: pd.Series) -> np.ndarray:
+    """
+    0/1 treatment indicator, coded the same way as the OLS path.
+    """
+    if treat.dtype == 'object' or treat.dtype == 'bool' or isinstance(treat.dtype, pd.CategoricalDtype):
+        codes = treat.astype('category').cat.codes.values
+    else:
+        codes = treat.values
+    if not np.isin(codes, (0, 1)).all():
+        raise ValueError("Treatment column must have exactly two levels (0/1).")
+    return codes.astype(bool)
+
+def cluster_aggregates(df: pd.DataFrame, y_col: str, treat_col: str, cluster_col: str) -> pd.DataFrame:
+    """
+    Per-cluster sufficient statistics for diff_in_means_from_aggregates.
+
+    Returns one row per cluster with columns n0, sum0, n1, sum1 (count and sum
+    of the outcome in control and treatment). Aggregates from disjoint row sets
+    can be added cluster-wise.
+    """
+    df2 = df.dropna(subset=[y_col, treat_col])
+    d = _treat_indicator(df2[treat_col])
+    y = df2[y_col].values.astype(float)
+    codes, clusters = pd.factorize(df2[cluster_col])
+    G = len(clusters)
+    return pd.DataFrame({
+        'n0': np.bincount(codes, weights=~d, minlength=G),
+        'sum0': np.bincount(codes, weights=np.where(d, 0.0, y), minlength=G),
+        'n1': np.bincount(codes, weights=d, minlength=G),
+        'sum1': np.bincount(codes, weights=np.where(d, y, 0.0), minlength=G),
+    }, index=pd.Index(clusters, name=cluster_col))
+
+def _crse_from_aggregates(n0, sum0, n1, sum1):
+    """
+    Array form of diff_in_means_from_aggregates.
+
+    Counts have shape (G,); sums have shape (G,) or (G, m) for m outcomes
+    sharing the same clusters. Returns arrays of shape () or (m,).
+    """
+    n0, sum0, n1, sum1 = (np.asarray(a, dtype=float) for a in (n0, sum0, n1, sum1))
+    G = int(((n0 + n1) > 0).sum())
+    if sum0.ndim == 2:
+        n0, n1 = n0[:, None], n1[:, None]
+    N0, N1 = n0.sum(axis=0), n1.sum(axis=0)
+    mean0, mean1 = sum0.sum(axis=0) / N0, sum1.sum(axis=0) / N1
+    lift = mean1 - mean0
+
+    N = N0 + N1
+    infl = (sum1 - n1 * mean1) / N1 - (sum0 - n0 * mean0) / N0
+    if G > 1:
+        se = np.sqrt(G / (G - 1) * (N - 1) / (N - 2) * np.sum(infl ** 2, axis=0))
+    else:
+        se = np.full_like(lift, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.where(se > 0, lift / se, np.nan)
+    return {
+        'lift': lift,
+        'se': se,
+        't': t,
+        'p': 2 * norm.sf(np.abs(t)),
+        'ci_low': lift - 1.96 * se,
+        'ci_high': lift + 1.96 * se
+    }
+
+def diff_in_means_from_aggregates(n0, sum0, n1, sum1):
+    """
+    Cluster-robust difference-in-means from per-cluster group counts and sums.
+
+    Closed form of OLS y ~ 1 + treat with statsmodels' cluster covariance
+    (small-sample factor G/(G-1) * (N-1)/(N-2), normal p-values): the lift's
+    influence per cluster is S1_g/N1 - S0_g/N0, where S_g are the cluster's
+    residual sums around each group mean.
+    """
+    return {k: float(v) for k, v in _crse_from_aggregates(n0, sum0, n1, sum1).items()}
+
+@instrument()
+def diff_in_means_crse(df: pd.DataFrame, y_col: str, treat_col: str, cluster_col: str, method: str = 'sufficient'):
     """
     Cluster-robust difference-in-means.
+
+    method='sufficient' (default) uses the closed form over per-cluster sums;
+    method='ols' fits the full statsmodels regression.
     """
+    if method == 'sufficient':
+        agg = cluster_aggregates(df, y_col, treat_col, cluster_col)
+        return diff_in_means_from_aggregates(agg['n0'], agg['sum0'], agg['n1'], agg['sum1'])
+    if method != 'ols':
+        raise ValueError(f"Unknown method '{method}'. Use 'sufficient' or 'ols'.")
+
     df2 = df.dropna(subset=[y_col, treat_col])
     # Ensure treatment column is numeric (0/1) for OLS
     if df2[treat_col].dtype == 'object' or df2[treat_col].dtype == 'bool':
@@ -28,6 +115,7 @@ def diff_in_means_crse(df: pd.DataFrame, y_col: str, treat_col: str, cluster_col
         'ci_high': float(lift + 1.96 * se)
     }
 
+@instrument()
 def cuped_transform(y: np.ndarray, x: np.ndarray):
     """
     CUPED variance reduction.
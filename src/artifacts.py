@@ -0,0 +1,63 @@
+# src/artifacts.py
+import json
+import os
+import numpy as np
+
+def save_arrays(path: str, arrays: dict, meta: dict = None, compress: bool = True, dtype=np.float32) -> str:
+    """
+    Write named arrays (floats cast to `dtype`) and JSON metadata to an .npz file.
+
+    Each array is stored as its own member, so readers can load only the
+    arrays they need. The file is written atomically.
+    """
+    out = {}
+    for name, values in arrays.items():
+        values = np.asarray(values)
+        out[name] = values.astype(dtype) if np.issubdtype(values.dtype, np.floating) else values
+    out['__meta__'] = np.frombuffer(json.dumps(meta or {}).encode("utf-8"), dtype=np.uint8)
+    tmp = path + '.tmp.npz'
+    (np.savez_compressed if compress else np.savez)(tmp, **out)
+    os.replace(tmp, path)
+    return path
+
+def load_meta(path: str) -> dict:
+    with np.load(path) as f:
+        return json.loads(f['__meta__'].tobytes().decode("utf-8"))
+
+def load_array(path: str, name: str) -> np.ndarray:
+    """
+    One array from a file written by save_arrays; other members are not read.
+    """
+    with np.load(path) as f:
+        if name not in f.files:
+            raise ValueError(f"Array '{name}' not found in '{path}'.")
+        return f[name]
+
+def minmax_downsample(y, n_buckets: int):
+    """
+    Indices and values of a series reduced to the min and max of each of n_buckets buckets.
+
+    Keeps every spike and dip visible when plotting len(y) >> pixels points;
+    returns at most 2 * n_buckets points (plus the endpoints), in order.
+    Series that are already small enough are returned unchanged.
+    """
+    y = np.asarray(y)
+    n = len(y)
+    if n <= 2 * n_buckets:
+        return np.arange(n), y
+    size = -(-n // n_buckets)
+    padded = np.concatenate([y, np.full(size * n_buckets - n, y[-1])]).reshape(n_buckets, size)
+    start = np.arange(n_buckets) * size
+    idx = np.concatenate([start + padded.argmin(axis=1), start + padded.argmax(axis=1), [0, n - 1]])
+    idx = np.unique(np.minimum(idx, n - 1))
+    return idx, y[idx]
+
+if __name__ == "__main__":
+    # Example usage
+    import tempfile
+    rng = np.random.default_rng(0)
+    trace = np.cumsum(rng.normal(100, 10, 10_000_000))
+    path = save_arrays(os.path.join(tempfile.gettempdir(), 'trace.npz'), {'reward_trace': trace}, {'n_steps': len(trace)})
+    print("File size (MB):", round(os.path.getsize(path) / 2**20, 1), "vs JSON ~", round(len(trace) * 19 / 2**20), "MB")
+    x, y = minmax_downsample(load_array(path, 'reward_trace'), 1200)
+    print("Points plotted:", len(x), "meta:", load_meta(path))
@@ -2,6 +2,9 @@
 import pandas as pd
 import numpy as np
 import hashlib
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 
 def hash_user(user_id: str, salt: str = "") -> float:
     """
@@ -11,31 +14,82 @@ def hash_user(user_id: str, salt: str = "") -> float:
     h = hashlib.sha256((str(user_id) + salt).encode("utf-8")).hexdigest()
     return int(h[:8], 16) / 0xFFFFFFFF
 
+def _hash_prefixes(user_ids, salt: str) -> np.ndarray:
+    """
+    First 32 bits of sha256(user_id + salt) for each id, as uint32.
+
+    Equivalent to int(hexdigest[:8], 16) but reads the raw digest bytes.
+    """
+    salt_b = salt.encode("utf-8")
+    sha = hashlib.sha256
+    buf = b"".join([sha(str(uid).encode("utf-8") + salt_b).digest()[:4] for uid in user_ids])
+    return np.frombuffer(buf, dtype=">u4").astype(np.uint32)
+
+# Below this many ids, starting a process pool costs more than it saves
+MIN_PARALLEL_ROWS = 50_000
+
+def hash_users(user_ids, salt: str = "", n_jobs: int = 1, chunk_size: int = 1_000_000) -> np.ndarray:
+    """
+    Batched version of hash_user over an array of user ids.
+    Returns float64 values in [0,1], identical to hash_user for every id.
+
+    With n_jobs > 1 and at least MIN_PARALLEL_ROWS ids, the ids are split
+    into at least n_jobs roughly equal chunks of at most `chunk_size` and
+    hashed on a process pool.
+    """
+    user_ids = np.asarray(user_ids, dtype=object)
+    if n_jobs > 1 and len(user_ids) >= MIN_PARALLEL_ROWS:
+        n_chunks = max(n_jobs, -(-len(user_ids) // chunk_size))
+        chunks = np.array_split(user_ids, n_chunks)
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            prefixes = np.concatenate(list(pool.map(_hash_prefixes, chunks, [salt] * len(chunks))))
+    else:
+        prefixes = _hash_prefixes(user_ids, salt)
+    return prefixes / 0xFFFFFFFF
+
+def bucket_variants(hash_values: np.ndarray, num_variants: int) -> np.ndarray:
+    """
+    Map hash values in [0,1] to variant indexes, as in assign_users.
+    """
+    idx = (hash_values * num_variants).astype(np.int64)
+    # A hash of exactly 0xFFFFFFFF maps to 1.0; keep it in the last bucket
+    return np.minimum(idx, num_variants - 1)
+
 def assign_users(
     users_df: pd.DataFrame,
     exp_id: str,
     variant_list: list,
     strata_cols: list = None,
-    seed: int = 42
+    seed: int = 42,
+    n_jobs: int = 1,
+    categorical: bool = False
 ) -> pd.DataFrame:
     """
     Assign users to experiment variants with stratification.
+
+    Hashing is batched over the whole user_id column (see hash_users). With
+    categorical=True the variant column is returned as a pandas Categorical
+    with categories in variant_list order.
     """
     np.random.seed(seed)
-    df = users_df.copy()
+    # Only the id and strata columns are needed for the output
+    df = users_df[['user_id'] + list(strata_cols or [])].copy()
     df['bucket_ts'] = pd.Timestamp.now()
     
     # Create strata column
     if strata_cols:
-        df['strata'] = df[strata_cols].astype(str).agg('_'.join, axis=1)
+        strata = df[strata_cols[0]].astype(str)
+        for col in strata_cols[1:]:
+            strata = strata.str.cat(df[col].astype(str), sep='_')
+        df['strata'] = strata
     else:
         df['strata'] = "all"
     
     # Use a single, vectorized operation for deterministic assignment
-    df['hash_value'] = df['user_id'].apply(lambda uid: hash_user(uid, exp_id))
-    num_variants = len(variant_list)
-    df['variant_idx'] = (df['hash_value'] * num_variants).astype(int)
-    df['variant'] = df['variant_idx'].apply(lambda i: variant_list[i])
+    hash_values = hash_users(df['user_id'].values, exp_id, n_jobs=n_jobs)
+    variant_idx = bucket_variants(hash_values, len(variant_list))
+    variant = pd.Categorical.from_codes(variant_idx, categories=variant_list)
+    df['variant'] = variant if categorical else np.asarray(variant_list, dtype=object)[variant_idx]
     
     # Add exp_id to the DataFrame before creating the subset
     df['exp_id'] = exp_id
@@ -43,6 +97,123 @@ def assign_users(
     assignments_df = df[['user_id','variant','bucket_ts','strata','exp_id']].copy()
     return assignments_df
 
+def _unit_hash(user_id, salt_b: bytes) -> float:
+    """
+    hash_user with a pre-encoded salt.
+    """
+    digest = hashlib.sha256(str(user_id).encode("utf-8") + salt_b).digest()
+    return int.from_bytes(digest[:4], "big") / 0xFFFFFFFF
+
+class Assigner:
+    """
+    In-process variant assignment for serving traffic one user at a time.
+
+    Each experiment config is a dict with keys:
+        exp_id:   experiment id, also the default hashing salt
+        variants: list of variant names
+        weights:  optional non-negative traffic weights per variant with a positive sum
+                  (default: equal split)
+        salt:     optional salt overriding exp_id
+        layer:    optional layer name; experiments sharing a layer are mutually exclusive
+        traffic:  share of the layer given to this experiment, in (0, 1] (default 1.0);
+                  requires a layer
+
+    Configs are compiled once at construction and misconfigurations raise
+    ValueError. Without weights, variants match assign_users for the same
+    exp_id/salt.
+    """
+    def __init__(self, experiments: list, cache_size: int = 0):
+        self.experiments = {}
+        layer_used = {}
+        for cfg in experiments:
+            exp_id = cfg['exp_id']
+            if exp_id in self.experiments:
+                raise ValueError(f"Duplicate experiment '{exp_id}'.")
+            variants = tuple(cfg['variants'])
+            weights = cfg.get('weights')
+            if weights is not None:
+                if len(weights) != len(variants):
+                    raise ValueError(f"Experiment '{exp_id}' has {len(variants)} variants but {len(weights)} weights.")
+                w = np.asarray(weights, dtype=float)
+                if not np.all(np.isfinite(w)) or np.any(w < 0) or w.sum() <= 0:
+                    raise ValueError(f"Experiment '{exp_id}' weights must be finite, non-negative and sum to more than 0.")
+                cum = np.cumsum(w)
+                thresholds = tuple(cum[:-1] / cum[-1])
+            else:
+                thresholds = None
+
+            # Experiments in a layer take consecutive slices of the layer's hash space
+            layer = cfg.get('layer')
+            layer_range = None
+            if layer is None and 'traffic' in cfg:
+                raise ValueError(f"Experiment '{exp_id}' sets traffic without a layer.")
+            if layer is not None:
+                traffic = float(cfg.get('traffic', 1.0))
+                if not 0.0 < traffic <= 1.0:
+                    raise ValueError(f"Experiment '{exp_id}' traffic must be in (0, 1], got {traffic}.")
+                lo = layer_used.get(layer, 0.0)
+                if lo + traffic > 1.0 + 1e-9:
+                    raise ValueError(f"Traffic in layer '{layer}' exceeds 100%.")
+                layer_used[layer] = lo + traffic
+                # The slice reaching 100% is closed above, so a hash of exactly 1.0 is not orphaned
+                layer_range = (lo, lo + traffic if lo + traffic < 1.0 - 1e-9 else float('inf'))
+
+            self.experiments[exp_id] = {
+                'variants': variants,
+                'salt': str(cfg.get('salt', exp_id)).encode("utf-8"),
+                'thresholds': thresholds,
+                'layer_salt': None if layer is None else str(layer).encode("utf-8"),
+                'layer_range': layer_range,
+            }
+
+        if cache_size > 0:
+            self.get_variant = lru_cache(maxsize=cache_size)(self.get_variant)
+
+    def get_variant(self, user_id, exp_id: str):
+        """
+        Variant of `exp_id` for one user, or None if the user's layer slice
+        belongs to another experiment.
+        """
+        exp = self.experiments[exp_id]
+        if exp['layer_range'] is not None:
+            lo, hi = exp['layer_range']
+            if not lo <= _unit_hash(user_id, exp['layer_salt']) < hi:
+                return None
+        h = _unit_hash(user_id, exp['salt'])
+        variants = exp['variants']
+        if exp['thresholds'] is None:
+            return variants[min(int(h * len(variants)), len(variants) - 1)]
+        return variants[bisect_right(exp['thresholds'], h)]
+
+    def assign(self, user_id) -> dict:
+        """
+        Variants for every experiment the user is enrolled in.
+        """
+        out = {}
+        for exp_id in self.experiments:
+            variant = self.get_variant(user_id, exp_id)
+            if variant is not None:
+                out[exp_id] = variant
+        return out
+
+    def get_variants(self, user_ids, exp_id: str) -> np.ndarray:
+        """
+        Batched get_variant over an array of user ids (object array, None where not enrolled).
+        """
+        exp = self.experiments[exp_id]
+        salt = exp['salt'].decode("utf-8")
+        variants = np.asarray(exp['variants'] + (None,), dtype=object)
+        h = hash_users(user_ids, salt)
+        if exp['thresholds'] is None:
+            idx = bucket_variants(h, len(exp['variants']))
+        else:
+            idx = np.searchsorted(np.asarray(exp['thresholds']), h, side='right')
+        if exp['layer_range'] is not None:
+            lo, hi = exp['layer_range']
+            h_layer = hash_users(user_ids, exp['layer_salt'].decode("utf-8"))
+            idx = np.where((h_layer >= lo) & (h_layer < hi), idx, len(exp['variants']))
+        return variants[idx]
+
 def check_balance(assignments_df: pd.DataFrame, strata_col='strata') -> pd.DataFrame:
     """
     Checks balance of assignment per strata.
@@ -67,4 +238,8 @@ if __name__ == "__main__":
     })
     assignments = assign_users(users, 'exp_checkout_01', ['control','treatment'], strata_cols=['country','device'])
     print(assignments)
-    print(check_balance(assignments))
\ No newline at end of file
+    print(check_balance(assignments))
+
+    # Single-user serving path
+    assigner = Assigner([{'exp_id': 'exp_checkout_01', 'variants': ['control','treatment']}], cache_size=10_000)
+    print(assigner.get_variant('u1', 'exp_checkout_01'))
\ No newline at end of file
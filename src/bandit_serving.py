@@ -0,0 +1,220 @@
+# src/bandit_serving.py
+import os
+import tempfile
+import threading
+import numpy as np
+from src.bandits import ThompsonBernoulli, ThompsonGaussian, UCB1, EpsilonGreedy
+
+# Policy state arrays, by class, that the server snapshots and updates
+STATE_ATTRS = {
+    'ThompsonBernoulli': ['successes', 'failures'],
+    'ThompsonGaussian': ['mu', 'tau', 'n', 'sums'],
+    'UCB1': ['counts', 'values', 'total_counts'],
+    'EpsilonGreedy': ['counts', 'values'],
+}
+POLICY_CLASSES = {cls.__name__: cls for cls in (ThompsonBernoulli, ThompsonGaussian, UCB1, EpsilonGreedy)}
+
+def select_batch(kind: str, state: dict, n: int, rng: np.random.Generator, epsilon: float = 0.1) -> np.ndarray:
+    """
+    Choose arms for n requests from one policy state with a single vectorized draw.
+    """
+    if kind == 'ThompsonBernoulli':
+        sample = rng.beta(state['successes'] + 1, state['failures'] + 1, size=(n, len(state['successes'])))
+        return np.argmax(sample, axis=1)
+    if kind == 'ThompsonGaussian':
+        sample = rng.normal(state['mu'], 1 / np.sqrt(state['tau']), size=(n, len(state['mu'])))
+        return np.argmax(sample, axis=1)
+    if kind == 'UCB1':
+        counts = state['counts']
+        untried = np.flatnonzero(counts == 0)
+        if len(untried) > 0:
+            # Spread the batch over untried arms, as sequential calls would
+            return untried[np.arange(n) % len(untried)]
+        total = state['total_counts'] + n
+        ucb = state['values'] + np.sqrt(2 * np.log(total) / counts)
+        return np.full(n, np.argmax(ucb))
+    if kind == 'EpsilonGreedy':
+        values = state['values']
+        explore = rng.random(n) < epsilon
+        return np.where(explore, rng.integers(0, len(values), n), np.argmax(values))
+    raise ValueError(f"Unsupported policy '{kind}'.")
+
+def update_batch(kind: str, state: dict, arms: np.ndarray, rewards: np.ndarray) -> dict:
+    """
+    New policy state after a batch of (arm, reward) observations.
+
+    Equivalent to calling the class's update once per observation; the input
+    state is not modified.
+    """
+    n_arms = len(next(v for v in state.values() if np.ndim(v)))
+    arms = np.asarray(arms, dtype=np.int64)
+    rewards = np.asarray(rewards, dtype=float)
+    cnt = np.bincount(arms, minlength=n_arms).astype(float)
+    total = np.bincount(arms, weights=rewards, minlength=n_arms)
+    new = {k: np.copy(v) for k, v in state.items()}
+
+    if kind == 'ThompsonBernoulli':
+        wins = np.bincount(arms, weights=(rewards > 0), minlength=n_arms)
+        new['successes'] += wins
+        new['failures'] += cnt - wins
+    elif kind == 'ThompsonGaussian':
+        new['n'] += cnt
+        new['sums'] += total
+        seen = new['n'] > 0
+        new['tau'][seen] = 1 + new['n'][seen]
+        new['mu'][seen] = new['sums'][seen] / new['tau'][seen]
+    elif kind in ('UCB1', 'EpsilonGreedy'):
+        old_n = new['counts'].copy()
+        new['counts'] += cnt
+        seen = cnt > 0
+        new['values'][seen] = (old_n[seen] * new['values'][seen] + total[seen]) / new['counts'][seen]
+    else:
+        raise ValueError(f"Unsupported policy '{kind}'.")
+    return new
+
+class PolicyServer:
+    """
+    Serve a bandit policy from src/bandits.py to concurrent request handlers.
+
+    select_arms reads an immutable state snapshot without locking. Rewards
+    passed to record are buffered and applied in batches by a background
+    thread (or by flush), which publishes a new snapshot and mirrors it onto
+    the wrapped policy object.
+    """
+    def __init__(self, policy, flush_interval: float = 0.05, max_buffer: int = 100_000, seed: int = None):
+        self.kind = type(policy).__name__
+        if self.kind not in STATE_ATTRS:
+            raise ValueError(f"Unsupported policy '{self.kind}'.")
+        self.policy = policy
+        self.epsilon = getattr(policy, 'epsilon', 0.1)
+        self._state = {a: np.array(getattr(policy, a), dtype=float) for a in STATE_ATTRS[self.kind]}
+        self._rng = np.random.default_rng(seed)
+        self._buffer = []
+        self._buffered = 0
+        self._buffer_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._worker = None
+
+    def start(self):
+        """
+        Start the background update thread.
+        """
+        if self._worker is None:
+            self._stop.clear()
+            self._worker = threading.Thread(target=self._run, daemon=True)
+            self._worker.start()
+        return self
+
+    def stop(self):
+        """
+        Stop the background thread and apply any buffered rewards.
+        """
+        if self._worker is not None:
+            self._stop.set()
+            self._wake.set()
+            self._worker.join()
+            self._worker = None
+        self.flush()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def select_arms(self, n: int) -> np.ndarray:
+        """
+        Arms for n requests, drawn from the current snapshot.
+        """
+        state = self._state
+        return select_batch(self.kind, state, n, self._rng, self.epsilon)
+
+    def select_arm(self) -> int:
+        return int(self.select_arms(1)[0])
+
+    def record(self, arms, rewards):
+        """
+        Buffer observed rewards for one or more served arms.
+        """
+        arms = np.atleast_1d(np.asarray(arms, dtype=np.int64))
+        rewards = np.atleast_1d(np.asarray(rewards, dtype=float))
+        if arms.shape != rewards.shape:
+            raise ValueError("arms and rewards must have the same length.")
+        with self._buffer_lock:
+            self._buffer.append((arms, rewards))
+            self._buffered += len(arms)
+            full = self._buffered >= self.max_buffer
+        if full:
+            self._wake.set()
+
+    def flush(self):
+        """
+        Apply all buffered rewards now and publish the new snapshot.
+        """
+        with self._flush_lock:
+            with self._buffer_lock:
+                pending, self._buffer, self._buffered = self._buffer, [], 0
+            if not pending:
+                return
+            arms = np.concatenate([a for a, _ in pending])
+            rewards = np.concatenate([r for _, r in pending])
+            new = update_batch(self.kind, self._state, arms, rewards)
+            if self.kind == 'UCB1':
+                # The class counts one pull per selection; count served pulls instead
+                new['total_counts'] = new['counts'].sum()
+            self._state = new
+            for attr, value in new.items():
+                setattr(self.policy, attr, value.copy() if value.ndim else value.item())
+
+    def snapshot(self) -> dict:
+        """
+        Copy of the current policy state.
+        """
+        return {k: np.copy(v) for k, v in self._state.items()}
+
+    def save(self, path: str):
+        """
+        Checkpoint the policy state (after applying buffered rewards) to an .npz file.
+        """
+        self.flush()
+        tmp = path + '.tmp.npz'
+        np.savez(tmp, kind=self.kind, epsilon=self.epsilon, **self._state)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str, **kwargs):
+        """
+        Rebuild a server, and the wrapped policy, from a checkpoint written by save.
+        """
+        with np.load(path) as ckpt:
+            kind = str(ckpt['kind'])
+            state = {a: ckpt[a] for a in STATE_ATTRS[kind]}
+            epsilon = float(ckpt['epsilon'])
+        n_arms = len(next(a for a in state.values() if a.ndim))
+        policy = POLICY_CLASSES[kind](n_arms, epsilon=epsilon) if kind == 'EpsilonGreedy' else POLICY_CLASSES[kind](n_arms)
+        for attr, value in state.items():
+            setattr(policy, attr, value.copy() if value.ndim else value.item())
+        return cls(policy, **kwargs)
+
+if __name__ == "__main__":
+    # Example usage
+    rng = np.random.default_rng(0)
+    true_gpv = np.array([100.0, 105.0])
+    with PolicyServer(ThompsonBernoulli(2), seed=0) as server:
+        for _ in range(200):
+            arms = server.select_arms(500)
+            server.record(arms, rng.random(len(arms)) < np.array([0.10, 0.12])[arms])
+    print("Allocation:", server.snapshot())
+    path = os.path.join(tempfile.gettempdir(), 'bandit_ckpt.npz')
+    server.save(path)
+    print("Restored:", PolicyServer.load(path).snapshot())
@@ -0,0 +1,142 @@
+# src/bandit_sim.py
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from scipy.stats import norm
+
+# Vectorized counterparts of the policies in src/bandits.py
+POLICIES = ['epsilon_greedy', 'ucb1', 'thompson_sampling', 'thompson_bernoulli']
+
+def _run_block(policy, true_means, n_steps, n_reps, reward, reward_sd, seed, params):
+    """
+    Run n_reps independent replications of one policy in lockstep.
+
+    State is held as (n_reps x n_arms) arrays and updated with the same rules
+    as the single-run classes. Returns sums that can be pooled across blocks.
+    """
+    rng = np.random.default_rng(seed)
+    means = np.asarray(true_means, dtype=float)
+    n_arms = len(means)
+    rows = np.arange(n_reps)
+    counts = np.zeros((n_reps, n_arms))
+    values = np.zeros((n_reps, n_arms))  # running mean reward (UCB1 / epsilon-greedy)
+    sums = np.zeros((n_reps, n_arms))
+    mu = np.full((n_reps, n_arms), float(params.get('mu0', 0.0)))
+    tau = np.full((n_reps, n_arms), 1 / float(params.get('sigma0', 1.0)) ** 2)
+    epsilon = float(params.get('epsilon', 0.1))
+
+    regret_step = means.max() - means
+    cum_regret = np.zeros(n_reps)
+    regret_sum = np.zeros(n_steps)
+    regret_sumsq = np.zeros(n_steps)
+
+    for step in range(n_steps):
+        if policy == 'thompson_sampling':
+            arm = np.argmax(rng.normal(mu, 1 / np.sqrt(tau)), axis=1)
+        elif policy == 'thompson_bernoulli':
+            successes = sums
+            arm = np.argmax(rng.beta(successes + 1, counts - successes + 1), axis=1)
+        elif policy == 'ucb1':
+            untried = counts == 0
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ucb = values + np.sqrt(2 * np.log(step + 1) / counts)
+            arm = np.where(untried.any(axis=1), untried.argmax(axis=1), np.argmax(ucb, axis=1))
+        elif policy == 'epsilon_greedy':
+            explore = rng.random(n_reps) < epsilon
+            arm = np.where(explore, rng.integers(0, n_arms, n_reps), np.argmax(values, axis=1))
+        else:
+            raise ValueError(f"Unknown policy '{policy}'. Expected one of {POLICIES}.")
+
+        if reward == 'bernoulli':
+            r = (rng.random(n_reps) < means[arm]).astype(float)
+        else:
+            r = rng.normal(means[arm], reward_sd)
+        if policy == 'thompson_bernoulli':
+            r = (r > 0).astype(float)
+
+        counts[rows, arm] += 1
+        n = counts[rows, arm]
+        sums[rows, arm] += r
+        values[rows, arm] += (r - values[rows, arm]) / n
+        tau[rows, arm] = 1 + n
+        mu[rows, arm] = sums[rows, arm] / tau[rows, arm]
+
+        cum_regret += regret_step[arm]
+        regret_sum[step] = cum_regret.sum()
+        regret_sumsq[step] = (cum_regret ** 2).sum()
+
+    return {
+        'n_reps': n_reps,
+        'correct': int((np.argmax(counts, axis=1) == np.argmax(means)).sum()),
+        'regret_sum': regret_sum,
+        'regret_sumsq': regret_sumsq,
+        'allocation': counts / n_steps,
+        'reward_sum': float(sums.sum()),
+    }
+
+def _wilson_ci(successes, n, alpha=0.05):
+    z = norm.ppf(1 - alpha / 2)
+    p = successes / n
+    centre = (p + z**2 / (2 * n)) / (1 + z**2 / n)
+    half = z * np.sqrt(p * (1 - p) / n + z**2 / (4 * n**2)) / (1 + z**2 / n)
+    return float(centre - half), float(centre + half)
+
+def simulate_bandit_replications(policy: str, true_means, n_steps: int = 1000, n_reps: int = 10000,
+                                 reward: str = 'gaussian', reward_sd: float = 1.0, seed: int = 42,
+                                 n_jobs: int = 1, alpha: float = 0.05, **params):
+    """
+    Monte Carlo study of a bandit policy over many independent replications.
+
+    Replications run in lockstep as arrays; with n_jobs > 1 they are split into
+    blocks on a process pool, each with an independent seed stream. Policy
+    parameters (epsilon, mu0, sigma0) are passed as keyword arguments.
+
+    Returns PCS (share of replications whose most-pulled arm is the best arm)
+    with a Wilson interval, the mean cumulative regret curve with a normal
+    interval per step, and the distribution of final allocation shares.
+    """
+    if reward not in ('gaussian', 'bernoulli'):
+        raise ValueError("reward must be 'gaussian' or 'bernoulli'.")
+    n_blocks = max(1, min(n_jobs, n_reps))
+    block_reps = [len(b) for b in np.array_split(np.arange(n_reps), n_blocks)]
+    seeds = np.random.SeedSequence(seed).spawn(n_blocks)
+    args = [(policy, true_means, n_steps, r, reward, reward_sd, s, params) for r, s in zip(block_reps, seeds)]
+
+    if n_blocks > 1:
+        with ProcessPoolExecutor(max_workers=n_blocks) as pool:
+            blocks = list(pool.map(_run_block, *zip(*args)))
+    else:
+        blocks = [_run_block(*args[0])]
+
+    correct = sum(b['correct'] for b in blocks)
+    regret_mean = sum(b['regret_sum'] for b in blocks) / n_reps
+    regret_var = np.maximum(sum(b['regret_sumsq'] for b in blocks) / n_reps - regret_mean**2, 0.0)
+    regret_half = norm.ppf(1 - alpha / 2) * np.sqrt(regret_var / n_reps)
+    allocation = np.concatenate([b['allocation'] for b in blocks])
+    alloc_mean = allocation.mean(axis=0)
+    alloc_half = norm.ppf(1 - alpha / 2) * allocation.std(axis=0, ddof=1) / np.sqrt(n_reps) if n_reps > 1 else np.nan
+
+    return {
+        'policy': policy,
+        'n_reps': n_reps,
+        'n_steps': n_steps,
+        'pcs': correct / n_reps,
+        'pcs_ci': _wilson_ci(correct, n_reps, alpha),
+        'regret_mean': regret_mean,
+        'regret_ci_low': regret_mean - regret_half,
+        'regret_ci_high': regret_mean + regret_half,
+        'final_regret': float(regret_mean[-1]),
+        'final_regret_ci': (float(regret_mean[-1] - regret_half[-1]), float(regret_mean[-1] + regret_half[-1])),
+        'allocation_mean': alloc_mean,
+        'allocation_ci_low': alloc_mean - alloc_half,
+        'allocation_ci_high': alloc_mean + alloc_half,
+        'allocation_quantiles': {q: np.quantile(allocation, q, axis=0) for q in (0.05, 0.5, 0.95)},
+        'mean_cumulative_reward': sum(b['reward_sum'] for b in blocks) / n_reps,
+    }
+
+if __name__ == "__main__":
+    # Example usage
+    for name in POLICIES:
+        means = [0.10, 0.12] if name == 'thompson_bernoulli' else [100, 105]
+        res = simulate_bandit_replications(name, means, n_steps=1000, n_reps=2000,
+                                           reward='bernoulli' if name == 'thompson_bernoulli' else 'gaussian')
+        print(name, "PCS:", round(res['pcs'], 4), res['pcs_ci'], "final regret:", round(res['final_regret'], 2))
@@ -1,5 +1,6 @@
 # src/bayes.py
 import numpy as np
+import pandas as pd
 from scipy.stats import norm
 
 def posterior_diff_normal(control: np.ndarray, treatment: np.ndarray, prior_mu=0.0, prior_sigma=1000.0):
@@ -16,22 +17,57 @@ def posterior_diff_normal(control: np.ndarray, treatment: np.ndarray, prior_mu=0
         posterior_mu: Posterior mean of lift (treatment - control)
         posterior_sigma: Posterior std of lift
     """
-    n_c = len(control)
-    n_t = len(treatment)
-    mean_c = np.mean(control)
-    mean_t = np.mean(treatment)
-    var_c = np.var(control, ddof=1)
-    var_t = np.var(treatment, ddof=1)
-    
-    # Likelihood variance
-    lik_var = var_c / n_c + var_t / n_t
-    # Posterior variance
-    post_var = 1 / (1/prior_sigma**2 + 1/lik_var)
-    # Posterior mean
-    post_mu = post_var * (prior_mu/prior_sigma**2 + (mean_t - mean_c)/lik_var)
-    post_sigma = np.sqrt(post_var)
-    
-    return post_mu, post_sigma
+    return posterior_diff_normal_batch(len(control), np.mean(control), np.var(control, ddof=1),
+                                       len(treatment), np.mean(treatment), np.var(treatment, ddof=1),
+                                       prior_mu, prior_sigma)
+
+def _shrinkage_prior(diff: np.ndarray, lik_var: np.ndarray):
+    """
+    DerSimonian-Laird estimate of the across-segment prior N(mu, tau^2) on the lift.
+
+    Returns (mu, tau^2, var(mu)); segments with a non-finite or zero
+    likelihood variance are ignored.
+    """
+    ok = np.isfinite(diff) & np.isfinite(lik_var) & (lik_var > 0)
+    d, v = diff[ok], lik_var[ok]
+    w = 1 / v
+    mu_fixed = np.sum(w * d) / np.sum(w)
+    q = np.sum(w * (d - mu_fixed) ** 2)
+    tau2 = max(0.0, (q - (len(d) - 1)) / (np.sum(w) - np.sum(w**2) / np.sum(w)))
+    w = 1 / (v + tau2)
+    return np.sum(w * d) / np.sum(w), tau2, 1 / np.sum(w)
+
+def posterior_diff_normal_batch(n_c, mean_c, var_c, n_t, mean_t, var_t, prior_mu=0.0, prior_sigma=1000.0,
+                                shrinkage: bool = False):
+    """
+    Posterior of the lift for many segments at once from sufficient statistics.
+
+    All arguments are arrays (or scalars) of per-segment counts, means and
+    ddof=1 variances; without shrinkage each segment gets the same
+    Normal-Normal update as posterior_diff_normal. With shrinkage=True the
+    prior is instead estimated across segments (empirical Bayes, DerSimonian-
+    Laird), so small, noisy segments are pulled towards the pooled lift; the
+    posterior variance includes the uncertainty of the pooled mean.
+
+    Returns:
+        posterior_mu, posterior_sigma: arrays with one entry per segment
+    """
+    n_c, mean_c, var_c, n_t, mean_t, var_t = np.broadcast_arrays(
+        *[np.asarray(a, dtype=float) for a in (n_c, mean_c, var_c, n_t, mean_t, var_t)])
+    diff = mean_t - mean_c
+    with np.errstate(divide='ignore', invalid='ignore'):
+        lik_var = var_c / n_c + var_t / n_t
+        valid = np.isfinite(diff) & np.isfinite(lik_var) & (lik_var > 0)
+        if shrinkage and valid.sum() > 1:
+            mu, tau2, var_mu = _shrinkage_prior(diff, lik_var)
+            # Share of each segment's estimate that is replaced by the pooled lift
+            weight = lik_var / (lik_var + tau2)
+            post_mu = diff - weight * (diff - mu)
+            post_var = lik_var * (1 - weight) + weight**2 * var_mu
+        else:
+            post_var = 1 / (1/prior_sigma**2 + 1/lik_var)
+            post_mu = post_var * (prior_mu/prior_sigma**2 + diff/lik_var)
+    return post_mu, np.sqrt(post_var)
 
 def prob_greater_than_zero(mu: float, sigma: float):
     """
@@ -58,6 +94,58 @@ def bayesian_lift_summary(control: np.ndarray, treatment: np.ndarray, rope=(-0.0
         'p_lift_in_rope': float(prob_in_rope(mu, sigma, rope))
     }
 
+def segment_sufficient_stats(df: pd.DataFrame, metrics: list, segment_cols: list, treat_col: str = 'variant',
+                             control='control', treatment='treatment') -> pd.DataFrame:
+    """
+    Per-segment, per-metric n, mean and variance of each variant from one groupby.
+
+    Returns one row per segment x metric: segment_cols, metric, n_c, mean_c,
+    var_c, n_t, mean_t, var_t. Missing values are excluded metric by metric.
+    """
+    grouped = df.groupby(list(segment_cols) + [treat_col], observed=True)[list(metrics)].agg(['count', 'mean', 'var'])
+    grouped.columns.names = ['metric', 'stat']
+    stats = grouped.stack('metric', future_stack=True).unstack(treat_col)
+    out = pd.DataFrame(index=stats.index)
+    for suffix, variant in (('c', control), ('t', treatment)):
+        for stat in ('count', 'mean', 'var'):
+            col = (stat, variant)
+            out[f"{'n' if stat == 'count' else stat}_{suffix}"] = stats[col] if col in stats.columns else np.nan
+    out[['n_c', 'n_t']] = out[['n_c', 'n_t']].fillna(0).astype(np.int64)
+    return out.reset_index()
+
+def bayesian_lift_batch(stats: pd.DataFrame, rope=(-0.005, 0.005), prior_mu=0.0, prior_sigma=1000.0,
+                        shrinkage: bool = False, pool_by: list = None) -> pd.DataFrame:
+    """
+    Posterior mean, sigma, P(lift>0) and P(lift in ROPE) for every row of `stats`.
+
+    stats has the columns of segment_sufficient_stats. With shrinkage, the
+    prior is estimated separately within each group of pool_by columns
+    (default: per metric, when a metric column is present).
+    """
+    stats = stats.copy()
+    cols = [stats[c].to_numpy(dtype=float) for c in ('n_c', 'mean_c', 'var_c', 'n_t', 'mean_t', 'var_t')]
+    if pool_by is None:
+        pool_by = ['metric'] if 'metric' in stats.columns else []
+    if shrinkage and pool_by:
+        mu, sigma = np.empty(len(stats)), np.empty(len(stats))
+        for rows in stats.groupby(pool_by, sort=False, observed=True).indices.values():
+            mu[rows], sigma[rows] = posterior_diff_normal_batch(*[c[rows] for c in cols], shrinkage=True)
+    else:
+        mu, sigma = posterior_diff_normal_batch(*cols, prior_mu, prior_sigma, shrinkage=shrinkage)
+    stats['posterior_mu'] = mu
+    stats['posterior_sigma'] = sigma
+    stats['p_lift_gt_0'] = prob_greater_than_zero(mu, sigma)
+    stats['p_lift_in_rope'] = prob_in_rope(mu, sigma, rope)
+    return stats
+
+def segment_lift_summary(df: pd.DataFrame, metrics: list, segment_cols: list, treat_col: str = 'variant',
+                         rope=(-0.005, 0.005), prior_mu=0.0, prior_sigma=1000.0, shrinkage: bool = False) -> pd.DataFrame:
+    """
+    bayesian_lift_summary for every segment x metric, in one vectorized pass.
+    """
+    stats = segment_sufficient_stats(df, metrics, segment_cols, treat_col)
+    return bayesian_lift_batch(stats, rope, prior_mu, prior_sigma, shrinkage)
+
 if __name__ == "__main__":
     # Example usage
     np.random.seed(42)
@@ -67,3 +155,14 @@ if __name__ == "__main__":
     summary = bayesian_lift_summary(control, treatment, rope=(-2,2))
     print("Bayesian Lift Summary:")
     print(summary)
+
+    n = 200_000
+    users = pd.DataFrame({
+        'country': np.random.choice(['US', 'UK', 'DE', 'FR', 'IN'], n),
+        'device': np.random.choice(['desktop', 'mobile', 'tablet'], n),
+        'traffic_source': np.random.choice(['organic', 'paid', 'email', 'social'], n),
+        'variant': np.random.choice(['control', 'treatment'], n),
+    })
+    users['gpv'] = np.random.exponential(100, n) + 3 * (users['variant'] == 'treatment')
+    seg = segment_lift_summary(users, ['gpv'], ['country', 'device', 'traffic_source'], rope=(-2, 2), shrinkage=True)
+    print(seg[['country', 'device', 'traffic_source', 'n_c', 'n_t', 'posterior_mu', 'posterior_sigma', 'p_lift_gt_0']].head())
@@ -0,0 +1,180 @@
+# src/benchmarks.py
+import json
+import os
+import platform
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from src.profiling import RunProfiler
+from src.simulate import generate_users, simulate_funnel
+from src.assign import assign_users
+from src.ab_testing import per_user_gpv
+from src.analyze import diff_in_means_crse
+from src.sequential import sequential_monitoring
+from src.metrics import guardrails
+from src.uplift import UpliftEngine, _MODEL_CACHE
+
+SIZES = [10**3, 10**4, 10**5, 10**6, 10**7]
+
+def _assigned_users(n: int, seed: int = 42):
+    users = generate_users(n, seed=seed)
+    assignments = assign_users(users, 'bench', ['control', 'treatment'], strata_cols=['country', 'device'])
+    return users.merge(assignments[['user_id', 'variant']], on='user_id'), assignments
+
+def _experiment(n: int):
+    users, assignments = _assigned_users(n)
+    sessions, events, orders, perf = simulate_funnel(users, lift=0.05, seed=42)
+    return users, assignments, sessions, events, orders, perf
+
+def _user_table(n: int) -> pd.DataFrame:
+    users, assignments, sessions, _, orders, _ = _experiment(n)
+    df = per_user_gpv(sessions, orders, assignments)
+    df = df.merge(users[['user_id', 'country', 'device', 'traffic_source', 'past_7d_gpv']], on='user_id')
+    df['day'] = np.random.default_rng(0).integers(1, 15, len(df))
+    return df
+
+def _uplift_frame(n: int) -> pd.DataFrame:
+    df = _user_table(n)
+    df['treat'] = (df['variant'] == 'treatment').astype(int)
+    return pd.get_dummies(df, columns=['country', 'device', 'traffic_source'], drop_first=True, dtype=float)
+
+def _uplift_learners(df: pd.DataFrame):
+    features = ['past_7d_gpv'] + [c for c in df.columns if c.startswith(('country_', 'device_', 'traffic_source_'))]
+    # Time the fits, not the memoized models of an earlier repeat
+    _MODEL_CACHE.clear()
+    engine = UpliftEngine(df, 'gpv', 'treat', features, backend='hist')
+    return engine.t_learner(), engine.x_learner()
+
+def _gpv_inputs(n: int):
+    _, assignments, sessions, _, orders, _ = _experiment(n)
+    return sessions, orders, assignments
+
+def _guardrail_inputs(n: int):
+    _, _, sessions, events, orders, perf = _experiment(n)
+    return sessions, orders, events, perf
+
+# name: (setup(n) -> args, timed function(*args), largest size run by default)
+CASES = {
+    'assign_users': (lambda n: (generate_users(n),),
+                     lambda users: assign_users(users, 'bench', ['control', 'treatment'], strata_cols=['country', 'device']),
+                     10**7),
+    'simulate_funnel': (lambda n: (_assigned_users(n)[0],),
+                        lambda users: simulate_funnel(users, lift=0.05, seed=42),
+                        10**7),
+    'per_user_gpv': (_gpv_inputs, per_user_gpv, 10**7),
+    'diff_in_means_crse': (lambda n: (_user_table(n),),
+                           lambda df: diff_in_means_crse(df, 'gpv', 'variant', 'user_id'),
+                           10**7),
+    'sequential_monitoring': (lambda n: (_user_table(n),),
+                              lambda df: sequential_monitoring(df, 'gpv', 'variant', 'user_id'),
+                              10**7),
+    'guardrails': (_guardrail_inputs, guardrails, 10**7),
+    'uplift_learners': (lambda n: (_uplift_frame(n),), _uplift_learners, 10**6),
+}
+
+def run_case(name: str, n: int, repeats: int = 1) -> dict:
+    """
+    Time one case at n users (best of `repeats`) and record the peak RSS of the timed calls.
+
+    Meant to run in a fresh process so the peak is not inflated by earlier cases.
+    """
+    setup, fn, _ = CASES[name]
+    args = setup(n)
+    profiler = RunProfiler(sample_interval=0.005)
+    walls, cpus, peak, base = [], [], 0.0, None
+    for _ in range(repeats):
+        with profiler.stage(name) as rec:
+            fn(*args)
+        walls.append(rec['wall_s'])
+        cpus.append(rec['cpu_s'])
+        peak = max(peak, rec['peak_rss_mb'])
+        base = rec['rss_start_mb'] if base is None else min(base, rec['rss_start_mb'])
+    wall = min(walls)
+    return {'case': name, 'n_users': n, 'repeats': repeats, 'wall_s': wall, 'cpu_s': min(cpus),
+            'users_per_s': n / wall, 'peak_rss_mb': peak, 'rss_delta_mb': peak - base}
+
+def _git_commit() -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        commit, dirty = None, None
+    return {'commit': commit, 'dirty': dirty}
+
+def run_suite(cases: list = None, sizes: list = None, repeats: int = 3, max_users: int = None,
+              isolate: bool = True) -> pd.DataFrame:
+    """
+    Run every case at every size up to the case's (or max_users') limit.
+
+    With isolate, each (case, size) runs in a new worker process. Results
+    are tagged with the git commit, host and timestamp.
+    """
+    cases = cases or list(CASES)
+    sizes = sizes or SIZES
+    unknown = [c for c in cases if c not in CASES]
+    if unknown:
+        raise ValueError(f"Unknown benchmark cases {unknown}. Expected a subset of {list(CASES)}.")
+    meta = dict(_git_commit(), host=platform.node(), python=platform.python_version(), timestamp=time.time())
+    rows = []
+    for name in cases:
+        limit = min(CASES[name][2], max_users) if max_users else CASES[name][2]
+        for n in [s for s in sizes if s <= limit]:
+            reps = repeats if n <= 10**5 else 1
+            if isolate:
+                with ProcessPoolExecutor(max_workers=1) as pool:
+                    res = pool.submit(run_case, name, n, reps).result()
+            else:
+                res = run_case(name, n, reps)
+            rows.append(dict(meta, **res))
+            print(f"{name:<22} n={n:>10,}  {res['wall_s']:9.3f}s  {res['users_per_s']:14,.0f} users/s  "
+                  f"peak {res['peak_rss_mb']:8.1f} MB")
+    return pd.DataFrame(rows)
+
+def append_results(results: pd.DataFrame, path: str = 'data/benchmarks.jsonl'):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'a') as f:
+        for rec in results.to_dict('records'):
+            f.write(json.dumps(rec, default=str) + '\n')
+    return path
+
+def load_results(path: str = 'data/benchmarks.jsonl') -> pd.DataFrame:
+    return pd.read_json(path, lines=True) if os.path.exists(path) else pd.DataFrame()
+
+def compare(current: pd.DataFrame, history: pd.DataFrame, baseline: str = None, threshold: float = 0.2) -> pd.DataFrame:
+    """
+    Compare a run with a baseline run from the same host.
+
+    The baseline is a single commit: the most recently run commit matching
+    `baseline` (a prefix is enough) or, by default, the most recently run
+    commit other than the current one. Each case is compared with that
+    commit's latest run of it; cases it did not run are left out. A case is a
+    regression if its throughput falls, or its peak memory grows, by more
+    than `threshold` (a fraction).
+    """
+    keys = ['case', 'n_users']
+    if history.empty:
+        return pd.DataFrame()
+    hist = history[history['host'] == current['host'].iloc[0]]
+    if baseline:
+        hist = hist[hist['commit'].astype(str).str.startswith(baseline)]
+    else:
+        hist = hist[hist['commit'] != current['commit'].iloc[0]]
+    if hist.empty:
+        return pd.DataFrame()
+    hist = hist.sort_values('timestamp')
+    hist = hist[hist['commit'] == hist['commit'].iloc[-1]]
+    base = hist.groupby(keys).tail(1)
+    out = current[keys + ['users_per_s', 'peak_rss_mb']].merge(
+        base[keys + ['commit', 'users_per_s', 'peak_rss_mb']], on=keys, suffixes=('', '_base'))
+    out['throughput_change'] = out['users_per_s'] / out['users_per_s_base'] - 1
+    out['memory_change'] = out['peak_rss_mb'] / out['peak_rss_mb_base'] - 1
+    out['regression'] = (out['throughput_change'] < -threshold) | (out['memory_change'] > threshold)
+    return out.rename(columns={'commit': 'baseline_commit'})
+
+if __name__ == "__main__":
+    # Example usage
+    res = run_suite(['assign_users', 'diff_in_means_crse'], sizes=[10**3, 10**4], repeats=2)
+    print(res[['case', 'n_users', 'users_per_s', 'peak_rss_mb']])
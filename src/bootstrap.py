@@ -0,0 +1,163 @@
+# src/bootstrap.py
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from scipy.stats import norm, poisson
+from src.analyze import _treat_indicator
+from src.profiling import instrument
+
+# Poisson(1) CDF thresholds for drawing bootstrap weights from float32 uniforms;
+# the tail beyond float32 resolution (~1e-7 mass) is truncated
+_POISSON_CDF = poisson.cdf(np.arange(1, 16), 1.0).astype(np.float32)
+_POISSON_CDF = np.concatenate([[np.float32(np.exp(-1.0))], _POISSON_CDF[_POISSON_CDF < 1]])
+
+# Column order of the per-cluster aggregates
+AGG_COLS = ['n0', 'sy0', 'sx0', 'n1', 'sy1', 'sx1', 'sxy', 'sxx']
+
+_worker_aggs = None
+
+def cuped_cluster_aggregates(df: pd.DataFrame, y_col: str, x_col: str, treat_col: str, cluster_col: str) -> np.ndarray:
+    """
+    Per-cluster sums needed to recompute the CUPED lift under any cluster weights.
+
+    Returns a (G x 8) array with columns AGG_COLS. With x_col=None the covariate
+    is taken as zero, i.e. a plain difference in means.
+    """
+    cols = [y_col, treat_col, cluster_col] + ([x_col] if x_col is not None else [])
+    df2 = df[cols].dropna()
+    d = _treat_indicator(df2[treat_col])
+    y = df2[y_col].to_numpy(dtype=float)
+    x = df2[x_col].to_numpy(dtype=float) if x_col is not None else np.zeros(len(df2))
+    # The lift and theta are shift-invariant; centring keeps the sums well conditioned
+    y = y - y.mean()
+    x = x - x.mean()
+    codes, clusters = pd.factorize(df2[cluster_col])
+    G = len(clusters)
+
+    def csum(w):
+        return np.bincount(codes, weights=w, minlength=G)
+    return np.column_stack([
+        csum(~d), csum(np.where(d, 0.0, y)), csum(np.where(d, 0.0, x)),
+        csum(d), csum(np.where(d, y, 0.0)), csum(np.where(d, x, 0.0)),
+        csum(x * y), csum(x * x),
+    ])
+
+def cuped_lift_from_totals(T: np.ndarray) -> np.ndarray:
+    """
+    CUPED lift from (weighted) totals with columns AGG_COLS; works row-wise on (B x 8).
+
+    Theta is the pooled cov(y, x) / var(x) as in cuped_transform; the lift is
+    the difference in group means of y - theta * x.
+    """
+    n0, sy0, sx0, n1, sy1, sx1, sxy, sxx = np.moveaxis(np.asarray(T, dtype=float), -1, 0)
+    n = n0 + n1
+    mx, my = (sx0 + sx1) / n, (sy0 + sy1) / n
+    varx = sxx / n - mx**2
+    cov = sxy / n - mx * my
+    # Same zero-variance guard as cuped_transform (its ddof=1 scaling cancels in the ratio)
+    theta = np.where(varx * n / np.maximum(n - 1, 1) > 1e-9, cov / np.where(varx > 0, varx, 1.0), 0.0)
+    return (sy1 - theta * sx1) / n1 - (sy0 - theta * sx0) / n0
+
+def _draw_weights(rng, n_rep: int, G: int, method: str) -> np.ndarray:
+    if method == 'poisson':
+        u = rng.random((n_rep, G), dtype=np.float32)
+        w = np.zeros((n_rep, G), dtype=np.float32)
+        for c in _POISSON_CDF:
+            w += u > c
+        return w
+    # Multinomial: G cluster draws with replacement per replicate
+    idx = rng.integers(0, G, (n_rep, G))
+    return np.stack([np.bincount(row, minlength=G) for row in idx]).astype(np.float32)
+
+def _init_worker(aggs):
+    global _worker_aggs
+    _worker_aggs = aggs
+
+def _boot_block(n_rep: int, seed, method: str, chunk_size: int, aggs=None) -> np.ndarray:
+    """
+    Bootstrap lifts for n_rep replicates, drawing weights chunk_size replicates at a time.
+    """
+    aggs = _worker_aggs if aggs is None else aggs
+    rng = np.random.default_rng(seed)
+    G = len(aggs)
+    out = np.empty(n_rep)
+    for start in range(0, n_rep, chunk_size):
+        b = min(chunk_size, n_rep - start)
+        W = _draw_weights(rng, b, G, method)
+        out[start:start + b] = cuped_lift_from_totals(W.astype(np.float64) @ aggs)
+    return out
+
+def _jackknife_lifts(aggs: np.ndarray) -> np.ndarray:
+    """
+    Leave-one-cluster-out lifts, in closed form from the aggregates.
+    """
+    return cuped_lift_from_totals(aggs.sum(axis=0) - aggs)
+
+@instrument()
+def bootstrap_cuped_lift(df: pd.DataFrame, y_col: str = 'gpv', x_col: str = 'past_7d_gpv',
+                         treat_col: str = 'variant', cluster_col: str = 'user_id', n_boot: int = 2000,
+                         method: str = 'poisson', alpha: float = 0.05, max_cells: int = 20_000_000,
+                         n_jobs: int = 1, seed: int = 42):
+    """
+    Cluster bootstrap percentile and BCa intervals for the CUPED lift of run_frequentist.
+
+    Clusters are resampled as weight matrices (Poisson(1) or multinomial
+    weights per cluster) applied to per-cluster sums, with theta re-estimated
+    in every replicate. Replicates are generated in chunks of at most
+    max_cells weights to bound memory, and split over n_jobs processes.
+    """
+    if method not in ('poisson', 'multinomial'):
+        raise ValueError("method must be 'poisson' or 'multinomial'.")
+    aggs = cuped_cluster_aggregates(df, y_col, x_col, treat_col, cluster_col)
+    G = len(aggs)
+    lift = float(cuped_lift_from_totals(aggs.sum(axis=0)))
+    chunk_size = max(1, int(max_cells // max(G, 1)))
+
+    n_blocks = max(1, min(n_jobs, n_boot))
+    block_reps = [len(b) for b in np.array_split(np.arange(n_boot), n_blocks)]
+    seeds = np.random.SeedSequence(seed).spawn(n_blocks)
+    if n_blocks > 1:
+        with ProcessPoolExecutor(max_workers=n_blocks, initializer=_init_worker, initargs=(aggs,)) as pool:
+            boot = np.concatenate(list(pool.map(_boot_block, block_reps, seeds, [method] * n_blocks, [chunk_size] * n_blocks)))
+    else:
+        boot = _boot_block(n_boot, seeds[0], method, chunk_size, aggs)
+    boot = boot[np.isfinite(boot)]
+
+    q = [alpha / 2, 1 - alpha / 2]
+    pct = np.quantile(boot, q)
+
+    # BCa: bias correction from the bootstrap distribution, acceleration from the jackknife
+    z0 = norm.ppf(np.clip(np.mean(boot < lift), 1 / len(boot), 1 - 1 / len(boot)))
+    jack = _jackknife_lifts(aggs)
+    dev = jack.mean() - jack
+    denom = 6 * np.sum(dev**2) ** 1.5
+    a = np.sum(dev**3) / denom if denom > 0 else 0.0
+    z = norm.ppf(q)
+    adj = norm.cdf(z0 + (z0 + z) / (1 - a * (z0 + z)))
+    bca = np.quantile(boot, adj)
+
+    return {
+        'lift': lift,
+        'se_boot': float(boot.std(ddof=1)),
+        'bias': float(boot.mean() - lift),
+        'ci_low_pct': float(pct[0]),
+        'ci_high_pct': float(pct[1]),
+        'ci_low_bca': float(bca[0]),
+        'ci_high_bca': float(bca[1]),
+        'z0': float(z0),
+        'acceleration': float(a),
+        'n_boot': int(len(boot)),
+        'method': method
+    }
+
+if __name__ == "__main__":
+    # Example usage
+    np.random.seed(42)
+    n = 5000
+    users = pd.DataFrame({
+        'user_id': [f'u{i}' for i in range(n)],
+        'variant': np.random.choice(['control','treatment'], n),
+        'past_7d_gpv': np.random.gamma(100, 1, n)
+    })
+    users['gpv'] = 0.3 * users['past_7d_gpv'] + np.random.exponential(20, n) + 2 * (users['variant'] == 'treatment')
+    print(bootstrap_cuped_lift(users, n_boot=2000))
@@ -0,0 +1,114 @@
+# src/funnel.py
+import numpy as np
+import pandas as pd
+from src.simulate import FUNNEL_EVENTS
+from src.storage import iter_table
+from src.profiling import instrument
+
+# Ordered conversion funnel (refund/support_ticket are guardrails, not steps)
+FUNNEL_STEPS = FUNNEL_EVENTS[:5]
+
+def user_step_matrix(events: pd.DataFrame, steps: list = FUNNEL_STEPS):
+    """
+    Users x steps boolean matrix of which funnel steps each user logged.
+
+    Returns (user ids, matrix); event names outside `steps` are ignored.
+    """
+    step = pd.Categorical(events['name'], categories=steps).codes
+    keep = step >= 0
+    codes, users = pd.factorize(events['user_id'][keep])
+    M = np.zeros((len(users), len(steps)), dtype=bool)
+    M[codes, step[keep]] = True
+    return users, M
+
+class FunnelEngine:
+    """
+    Step-to-step funnel conversion per variant and stratum, from events streamed in chunks.
+
+    Users are indexed once from the assignments table; each chunk of events
+    is reduced to a per-user bitmask of steps reached (one bit per step), so
+    users may appear in any number of chunks and memory is one byte per user.
+    """
+    def __init__(self, assignments: pd.DataFrame, steps: list = FUNNEL_STEPS, group_cols=('variant', 'strata')):
+        if len(steps) > 8:
+            raise ValueError("At most 8 funnel steps are supported.")
+        self.steps = list(steps)
+        self.group_cols = [c for c in group_cols if c in assignments.columns]
+        self._index = pd.Index(assignments['user_id'])
+        if self.group_cols:
+            self._groups, self._group_keys = pd.factorize(pd.MultiIndex.from_frame(assignments[self.group_cols].astype(str)))
+        else:
+            self._groups, self._group_keys = np.zeros(len(assignments), dtype=np.int64), pd.Index(['all'])
+        self.mask = np.zeros(len(assignments), dtype=np.uint8)
+
+    def update(self, events: pd.DataFrame):
+        """
+        Fold one chunk of events (user_id, name) into the per-user step bitmasks.
+        """
+        step = pd.Categorical(events['name'], categories=self.steps).codes
+        keep = step >= 0
+        pos = self._index.get_indexer(events['user_id'][keep])
+        known = pos >= 0
+        np.bitwise_or.at(self.mask, pos[known], (1 << step[keep][known]).astype(np.uint8))
+        return self
+
+    def results(self) -> pd.DataFrame:
+        """
+        Users reaching each step per group, with conversion from the previous step and from assignment.
+
+        users_reached_prefix counts users who logged steps 0..s (a strict
+        funnel), and the rates use it; users_logged counts users who logged
+        step s at all, which for place_order is the converter count of
+        conversion_rate and the Beta-Binomial report.
+        """
+        n_groups = len(self._group_keys)
+        assigned = np.bincount(self._groups, minlength=n_groups)
+        prefix = np.cumsum(1 << np.arange(len(self.steps)))
+        rows = []
+        prev = assigned.astype(float)
+        for s, name in enumerate(self.steps):
+            reached = np.bincount(self._groups, weights=(self.mask & prefix[s]) == prefix[s], minlength=n_groups)
+            logged = np.bincount(self._groups, weights=(self.mask >> s) & 1, minlength=n_groups)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                rows.append(pd.DataFrame({
+                    'step': name,
+                    'step_index': s,
+                    'users_assigned': assigned,
+                    'users_logged': logged.astype(np.int64),
+                    'users_reached_prefix': reached.astype(np.int64),
+                    'rate_from_previous': reached / prev,
+                    'rate_from_assigned': reached / assigned,
+                }))
+            prev = reached
+        keys = (self._group_keys.to_frame(index=False, name=self.group_cols) if self.group_cols
+                else pd.DataFrame({'group': self._group_keys}))
+        out = pd.concat([pd.concat([keys, r], axis=1) for r in rows], ignore_index=True)
+        return out.sort_values(list(keys.columns) + ['step_index'], kind='stable').reset_index(drop=True)
+
+@instrument()
+def funnel_conversion(assignments: pd.DataFrame, events=None, root: str = 'data', fmt: str = 'csv',
+                      chunk_size: int = 5_000_000, steps: list = FUNNEL_STEPS) -> pd.DataFrame:
+    """
+    Funnel conversion per variant and stratum.
+
+    `events` may be a DataFrame, an iterable of chunks, or None to stream the
+    events table from disk in chunks of chunk_size rows.
+    """
+    engine = FunnelEngine(assignments, steps)
+    if events is None:
+        events = iter_table('events', root, fmt, columns=['user_id', 'name'], chunk_size=chunk_size)
+    elif isinstance(events, pd.DataFrame):
+        events = [events]
+    for chunk in events:
+        engine.update(chunk)
+    return engine.results()
+
+if __name__ == "__main__":
+    # Example usage
+    from src.simulate import generate_users, simulate_funnel_chunks
+    from src.assign import assign_users
+    users = generate_users(20000, seed=3)
+    assignments = assign_users(users, 'funnel', ['control', 'treatment'], strata_cols=['device'])
+    users = users.merge(assignments[['user_id', 'variant']], on='user_id')
+    chunks = (events for _, events, _, _ in simulate_funnel_chunks(users, chunk_size=5000))
+    print(funnel_conversion(assignments, chunks).to_string())
@@ -0,0 +1,166 @@
+# src/guardrails.py
+import numpy as np
+import pandas as pd
+from src.sketch import TDigest
+
+LATENCY_QUANTILES = {'checkout_latency_p50': 0.50, 'checkout_latency_p95': 0.95, 'checkout_latency_p99': 0.99}
+# Event counters kept per (variant, day), in this column order
+COUNTERS = ['orders', 'refund', 'support_ticket']
+
+class GuardrailEngine:
+    """
+    Incremental guardrail metrics per variant and session day.
+
+    Sessions are indexed once (session_id -> variant, day); orders, events and
+    perf rows are then attributed by position lookup, or directly when they
+    already carry variant/session_day columns (as in the partitioned Parquet
+    dataset). Order, refund and support-ticket counts are kept per
+    (variant, day), and checkout latency is summarised by one TDigest per
+    (variant, day), so partitions and days can be combined without raw rows.
+    """
+    def __init__(self, compression: float = 200):
+        self.compression = compression
+        self.counts = {}
+        self.digests = {}
+        self._index = None
+
+    def index_sessions(self, sessions: pd.DataFrame):
+        """
+        Build the session_id -> (variant, day) lookup used for tables without keys.
+        """
+        self._index = pd.Index(sessions['session_id'])
+        self._variant_codes, self._variants = pd.factorize(sessions['variant'])
+        self._days = (sessions['session_day'].to_numpy(dtype=np.int64) if 'session_day' in sessions
+                      else np.zeros(len(sessions), dtype=np.int64))
+        return self
+
+    def _groups(self, df: pd.DataFrame):
+        """
+        (variant, day) keys of the rows of df, as a list of keys plus a group code per row.
+
+        Rows whose session is unknown get code -1.
+        """
+        if 'variant' in df.columns and 'session_day' in df.columns:
+            vcodes, variants = pd.factorize(df['variant'])
+            days = df['session_day'].to_numpy(dtype=np.int64)
+            known = vcodes >= 0
+        else:
+            if self._index is None:
+                raise ValueError("Call index_sessions first, or pass tables with variant/session_day columns.")
+            pos = self._index.get_indexer(df['session_id'])
+            known = pos >= 0
+            vcodes = np.where(known, self._variant_codes[pos], -1)
+            days = np.where(known, self._days[pos], 0)
+            variants = self._variants
+        codes = np.full(len(df), -1, dtype=np.int64)
+        if not known.any():
+            return [], codes
+        n_days = int(days[known].max()) + 1
+        uniq, inv = np.unique(vcodes[known].astype(np.int64) * n_days + days[known], return_inverse=True)
+        codes[known] = inv
+        return [(str(variants[u // n_days]), int(u % n_days)) for u in uniq], codes
+
+    def _add_counts(self, keys: list, counts: np.ndarray):
+        for key, row in zip(keys, counts):
+            self.counts[key] = self.counts.get(key, np.zeros(len(COUNTERS))) + row
+
+    def add_orders(self, orders: pd.DataFrame):
+        keys, codes = self._groups(orders)
+        counts = np.zeros((len(keys), len(COUNTERS)))
+        counts[:, 0] = np.bincount(codes[codes >= 0], minlength=len(keys))
+        self._add_counts(keys, counts)
+        return self
+
+    def add_events(self, events: pd.DataFrame):
+        """
+        Count refunds and support tickets in one pass over the events.
+        """
+        kind = pd.Categorical(events['name'], categories=COUNTERS[1:]).codes
+        events = events[kind >= 0]
+        kind = kind[kind >= 0]
+        keys, codes = self._groups(events)
+        keep = codes >= 0
+        flat = np.bincount(codes[keep] * 2 + kind[keep], minlength=2 * len(keys)).reshape(len(keys), 2)
+        counts = np.zeros((len(keys), len(COUNTERS)))
+        counts[:, 1:] = flat
+        self._add_counts(keys, counts)
+        return self
+
+    def add_perf(self, perf: pd.DataFrame):
+        keys, codes = self._groups(perf)
+        latency = perf['checkout_latency_ms'].to_numpy(dtype=float)
+        keep = codes >= 0
+        order = np.argsort(codes[keep], kind='stable')
+        bounds = np.searchsorted(codes[keep][order], np.arange(len(keys) + 1))
+        values = latency[keep][order]
+        for g, key in enumerate(keys):
+            if key not in self.digests:
+                self.digests[key] = TDigest(self.compression)
+            self.digests[key].update(values[bounds[g]:bounds[g + 1]])
+        return self
+
+    def update(self, sessions: pd.DataFrame = None, orders: pd.DataFrame = None, events: pd.DataFrame = None,
+               perf: pd.DataFrame = None):
+        """
+        Add one chunk or partition of the funnel tables; any table may be omitted.
+        """
+        if sessions is not None:
+            self.index_sessions(sessions)
+        if orders is not None:
+            self.add_orders(orders)
+        if events is not None:
+            self.add_events(events)
+        if perf is not None:
+            self.add_perf(perf)
+        return self
+
+    def merge(self, other: 'GuardrailEngine'):
+        """
+        Fold the counters and latency sketches of another engine into this one.
+        """
+        self._add_counts(list(other.counts), list(other.counts.values()))
+        for key, digest in other.digests.items():
+            self.digests.setdefault(key, TDigest(self.compression)).merge(digest)
+        return self
+
+    def summary(self, by_day: bool = False) -> pd.DataFrame:
+        """
+        Guardrails per variant (and session_day if by_day) in long form: variant, [session_day,] value, metric.
+
+        Latency quantiles come from merged sketches; refund rate is refunds per
+        100 orders and support tickets are per 1,000 orders.
+        """
+        def group(key):
+            return key if by_day else key[0]
+
+        counts, digests = {}, {}
+        for key, c in self.counts.items():
+            counts[group(key)] = counts.get(group(key), 0) + c
+        for key, d in self.digests.items():
+            digests.setdefault(group(key), TDigest(self.compression)).merge(d)
+
+        values = {}
+        for g, digest in digests.items():
+            for metric, value in zip(LATENCY_QUANTILES, digest.quantile(list(LATENCY_QUANTILES.values()))):
+                values.setdefault(metric, {})[g] = float(value)
+        for g, (orders, refunds, tickets) in counts.items():
+            values.setdefault('refund_rate', {})[g] = refunds / orders * 100 if orders else np.nan
+            values.setdefault('support_tickets_per_1k_orders', {})[g] = tickets / orders * 1000 if orders else np.nan
+
+        cols = ['variant', 'session_day'] if by_day else ['variant']
+        rows = []
+        for metric in list(LATENCY_QUANTILES) + ['refund_rate', 'support_tickets_per_1k_orders']:
+            for g in sorted(values.get(metric, {})):
+                rows.append((*(g if by_day else (g,)), values[metric][g], metric))
+        return pd.DataFrame(rows, columns=cols + ['value', 'metric'])
+
+if __name__ == "__main__":
+    # Example usage
+    from src.simulate import generate_users, simulate_funnel_chunks
+    from src.assign import assign_users
+    users = generate_users(20000, seed=1)
+    users = users.merge(assign_users(users, 'guard', ['control', 'treatment'])[['user_id', 'variant']], on='user_id')
+    engine = GuardrailEngine()
+    for sessions, events, orders, perf in simulate_funnel_chunks(users, chunk_size=5000):
+        engine.merge(GuardrailEngine().update(sessions, orders, events, perf))
+    print(engine.summary())
@@ -1,56 +1,33 @@
 # src/metrics.py
 import pandas as pd
 import numpy as np
+from src.guardrails import GuardrailEngine
 
 def compute_gpv(orders: pd.DataFrame) -> pd.Series:
     """
     Compute Gross Profit per Order (GPV).
     """
-    orders = orders.copy()
-    orders['gpv'] = orders['revenue'] - orders['discount'] - orders['var_cost']
-    return orders.set_index('session_id')['gpv']
+    gpv = orders['revenue'].values - orders['discount'].values - orders['var_cost'].values
+    return pd.Series(gpv, index=pd.Index(orders['session_id'], name='session_id'), name='gpv')
 
 def conversion_rate(events: pd.DataFrame, event_name='place_order') -> pd.DataFrame:
     """
     Compute conversion rate per user.
+
+    See src/funnel.py for step-to-step conversion across the whole funnel.
     """
-    conv = events.groupby('user_id')['name'].apply(lambda x: int(event_name in x.values))
-    return conv.reset_index(name='conversion')
+    codes, users = pd.factorize(events['user_id'], sort=True)
+    conv = np.zeros(len(users), dtype=np.int64)
+    conv[codes[(events['name'] == event_name).to_numpy()]] = 1
+    return pd.DataFrame({'user_id': users, 'conversion': conv})
 
 def guardrails(sessions: pd.DataFrame, orders: pd.DataFrame, events: pd.DataFrame, perf: pd.DataFrame) -> pd.DataFrame:
     """
     Compute guardrail metrics per variant.
+
+    Latency p50/p95/p99 are approximate (t-digest); see src/guardrails.py.
     """
-    # Get all unique variants
-    all_variants = sessions['variant'].drop_duplicates()
-    
-    # Checkout latency
-    latency = perf.merge(sessions[['session_id','variant']], on='session_id', how='left')
-    latency_summary = latency.groupby('variant')['checkout_latency_ms'].quantile(0.95).reset_index()
-    
-    # Refund rate
-    orders_count = orders.merge(sessions[['session_id','variant']], on='session_id', how='left').groupby('variant').size()
-    refunds_count = events[events['name']=='refund'].merge(sessions[['session_id','variant']], on='session_id', how='left').groupby('variant').size()
-    
-    # Use reindex to ensure all variants are present with 0 counts if no refunds
-    refund_rate = (refunds_count.reindex(all_variants, fill_value=0) / orders_count.reindex(all_variants, fill_value=0) * 100).reset_index(name='value')
-    
-    # Support tickets per 1k orders
-    tickets_count = events[events['name']=='support_ticket'].merge(sessions[['session_id','variant']], on='session_id', how='left').groupby('variant').size()
-    support_rate = (tickets_count.reindex(all_variants, fill_value=0) / orders_count.reindex(all_variants, fill_value=0) * 1000).reset_index(name='value')
-    
-    # Build the final DataFrame
-    latency_summary['metric'] = 'checkout_latency_p95'
-    refund_rate['metric'] = 'refund_rate'
-    support_rate['metric'] = 'support_tickets_per_1k_orders'
-    
-    guardrail_df = pd.concat([
-        latency_summary.rename(columns={'checkout_latency_ms':'value'}),
-        refund_rate,
-        support_rate
-    ], ignore_index=True)
-    
-    return guardrail_df
+    return GuardrailEngine().update(sessions, orders, events, perf).summary()
 
 def summarize_metrics(sessions, orders, events, perf):
     """
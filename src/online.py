@@ -0,0 +1,197 @@
+# src/online.py
+import os
+import numpy as np
+import pandas as pd
+from src.metrics import compute_gpv
+from src.ab_testing import run_frequentist, run_bayesian
+
+# Per-user counters, in checkpoint order
+COUNTERS = ['gpv', 'n_sessions', 'n_orders', 'converted', 'refunds', 'support_tickets']
+COUNTER_DTYPES = {'gpv': np.float64, 'n_sessions': np.int32, 'n_orders': np.int32, 'converted': np.uint8,
+                  'refunds': np.int32, 'support_tickets': np.int32}
+
+class OnlineAccumulator:
+    """
+    Incremental per-user experiment metrics from micro-batches of funnel tables.
+
+    Users are indexed once from the assignments table and their GPV,
+    sessions, orders, conversion (place_order) and guardrail counts are held
+    in one compact array each. Orders are attributed through the session ids
+    seen so far, searched newest batch first, so orders may arrive in a later
+    batch than their session. With session_ttl_batches set, a session is
+    closed once that many batches have arrived after its own and is evicted
+    when the batches are compacted; by default every session is kept. Orders
+    whose session is unknown or evicted are counted in `unmatched_orders`
+    (and reported by analyze) rather than attributed. Building the
+    per-user table costs time proportional to the number of users, not events.
+    """
+    def __init__(self, assignments: pd.DataFrame, users: pd.DataFrame = None, max_segments: int = 32,
+                 session_ttl_batches: int = None):
+        self.user_ids = pd.Index(assignments['user_id'])
+        self.variant_codes, self.variants = pd.factorize(assignments['variant'])
+        self.covariate = (users.set_index('user_id')['past_7d_gpv'].reindex(self.user_ids).to_numpy(dtype=float)
+                          if users is not None else np.full(len(self.user_ids), np.nan))
+        self.counters = {c: np.zeros(len(self.user_ids), dtype=t) for c, t in COUNTER_DTYPES.items()}
+        self.max_segments = max_segments
+        self.session_ttl_batches = session_ttl_batches
+        self._segments = []  # (session id index, user position, arrival batch) per batch
+        self.unmatched_orders = 0
+        self.batches = 0
+
+    def _register_sessions(self, sessions: pd.DataFrame) -> np.ndarray:
+        pos = self.user_ids.get_indexer(sessions['user_id'])
+        self._segments.append((pd.Index(sessions['session_id']), pos, np.full(len(pos), self.batches, dtype=np.int64)))
+        return pos
+
+    def _compact(self):
+        """
+        Merge the batches into one segment without the closed sessions, so
+        lookups of late orders touch a bounded number of indexes and the
+        index holds only sessions that can still receive orders.
+        """
+        ids = np.concatenate([seg[0].to_numpy() for seg in self._segments])
+        users = np.concatenate([seg[1] for seg in self._segments])
+        arrived = np.concatenate([seg[2] for seg in self._segments])
+        if self.session_ttl_batches is not None:
+            # Runs at the end of the current batch; keep what the next batch may still reference
+            keep = arrived > self.batches - self.session_ttl_batches
+            ids, users, arrived = ids[keep], users[keep], arrived[keep]
+        self._segments = [(pd.Index(ids), users, arrived)]
+
+    def _session_users(self, session_ids) -> np.ndarray:
+        """
+        User position for each session id, -1 if the session (or its user) is unknown.
+        """
+        out = np.full(len(session_ids), -1, dtype=np.int64)
+        todo = np.arange(len(session_ids))
+        ids = pd.Index(session_ids)
+        for index, users, _ in reversed(self._segments):
+            hit = index.get_indexer(ids[todo])
+            found = hit >= 0
+            out[todo[found]] = users[hit[found]]
+            todo = todo[~found]
+            if len(todo) == 0:
+                break
+        return out
+
+    def update(self, sessions: pd.DataFrame = None, events: pd.DataFrame = None, orders: pd.DataFrame = None):
+        """
+        Fold in one micro-batch; tables use the simulate_funnel schemas and any may be omitted.
+        """
+        n = len(self.user_ids)
+        c = self.counters
+        if sessions is not None and len(sessions):
+            pos = self._register_sessions(sessions)
+            c['n_sessions'] += np.bincount(pos[pos >= 0], minlength=n).astype(np.int32)
+        if events is not None and len(events):
+            kind = pd.Categorical(events['name'], categories=['place_order', 'refund', 'support_ticket']).codes
+            keep = kind >= 0
+            pos = self.user_ids.get_indexer(events['user_id'][keep])
+            kind = kind[keep][pos >= 0]
+            pos = pos[pos >= 0]
+            c['converted'][pos[kind == 0]] = 1
+            c['refunds'] += np.bincount(pos[kind == 1], minlength=n).astype(np.int32)
+            c['support_tickets'] += np.bincount(pos[kind == 2], minlength=n).astype(np.int32)
+        if orders is not None and len(orders):
+            pos = self._session_users(orders['session_id'])
+            known = pos >= 0
+            self.unmatched_orders += int((~known).sum())
+            c['gpv'] += np.bincount(pos[known], weights=compute_gpv(orders).values[known], minlength=n)
+            c['n_orders'] += np.bincount(pos[known], minlength=n).astype(np.int32)
+        # After this batch's orders are attributed, so its own sessions are never evicted first
+        if len(self._segments) > self.max_segments:
+            self._compact()
+        self.batches += 1
+        return self
+
+    def table(self, active_only: bool = True) -> pd.DataFrame:
+        """
+        Current per-user table (user_id, variant, past_7d_gpv and counters).
+
+        With active_only, users without a session so far are left out, as in per_user_gpv.
+        """
+        rows = self.counters['n_sessions'] > 0 if active_only else np.ones(len(self.user_ids), dtype=bool)
+        df = pd.DataFrame({'user_id': self.user_ids[rows],
+                           'variant': self.variants.take(self.variant_codes[rows]),
+                           'past_7d_gpv': self.covariate[rows]})
+        for name, values in self.counters.items():
+            df[name] = values[rows]
+        return df
+
+    def guardrail_summary(self) -> pd.DataFrame:
+        """
+        Refunds per 100 orders and support tickets per 1,000 orders, per variant.
+        """
+        k = len(self.variants)
+        codes = self.variant_codes[self.variant_codes >= 0]
+        sums = {name: np.bincount(codes, weights=self.counters[name][self.variant_codes >= 0], minlength=k)
+                for name in ('n_orders', 'refunds', 'support_tickets')}
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return pd.DataFrame({'variant': np.asarray(self.variants),
+                                 'refund_rate': sums['refunds'] / sums['n_orders'] * 100,
+                                 'support_tickets_per_1k_orders': sums['support_tickets'] / sums['n_orders'] * 1000})
+
+    def analyze(self) -> dict:
+        """
+        run_frequentist and run_bayesian on the current per-user table.
+        """
+        df = self.table().dropna(subset=['gpv', 'past_7d_gpv', 'variant'])
+        res_freq = run_frequentist(df)
+        res_bayes = run_bayesian(res_freq.pop('df_cuped'))
+        return {'frequentist': res_freq, 'bayesian': res_bayes, 'n_users': len(df), 'batches': self.batches,
+                'unmatched_orders': self.unmatched_orders}
+
+    def save(self, path: str):
+        """
+        Checkpoint the accumulator state to an .npz file.
+        """
+        sessions = [seg[0].to_numpy(dtype=str) for seg in self._segments]
+        tmp = path + '.tmp.npz'
+        np.savez_compressed(tmp, user_ids=self.user_ids.to_numpy(dtype=str), variant_codes=self.variant_codes,
+                            variants=np.asarray(self.variants, dtype=str), covariate=self.covariate,
+                            session_ids=np.concatenate(sessions) if sessions else np.empty(0, dtype=str),
+                            session_users=np.concatenate([seg[1] for seg in self._segments]) if sessions else np.empty(0, dtype=np.int64),
+                            session_batches=np.concatenate([seg[2] for seg in self._segments]) if sessions else np.empty(0, dtype=np.int64),
+                            session_ttl_batches=-1 if self.session_ttl_batches is None else self.session_ttl_batches,
+                            unmatched_orders=self.unmatched_orders,
+                            batches=self.batches, max_segments=self.max_segments,
+                            **{f'counter_{k}': v for k, v in self.counters.items()})
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str):
+        """
+        Restore an accumulator written by save.
+        """
+        with np.load(path) as ckpt:
+            acc = cls.__new__(cls)
+            acc.user_ids = pd.Index(ckpt['user_ids'].astype(object))
+            acc.variant_codes = ckpt['variant_codes']
+            acc.variants = pd.Index(ckpt['variants'].astype(object))
+            acc.covariate = ckpt['covariate']
+            acc.counters = {c: ckpt[f'counter_{c}'] for c in COUNTERS}
+            acc.max_segments = int(ckpt['max_segments'])
+            acc.session_ttl_batches = None if int(ckpt['session_ttl_batches']) < 0 else int(ckpt['session_ttl_batches'])
+            acc.unmatched_orders = int(ckpt['unmatched_orders'])
+            acc.batches = int(ckpt['batches'])
+            acc._segments = ([(pd.Index(ckpt['session_ids'].astype(object)), ckpt['session_users'], ckpt['session_batches'])]
+                             if len(ckpt['session_ids']) else [])
+        return acc
+
+if __name__ == "__main__":
+    # Example usage: replay a simulated experiment as micro-batches
+    import tempfile
+    from src.simulate import generate_users, simulate_funnel_chunks
+    from src.assign import assign_users
+    users = generate_users(20000, seed=5)
+    assignments = assign_users(users, 'online', ['control', 'treatment'])
+    acc = OnlineAccumulator(assignments, users)
+    users = users.merge(assignments[['user_id', 'variant']], on='user_id')
+    for sessions, events, orders, _ in simulate_funnel_chunks(users, lift=0.05, chunk_size=4000):
+        acc.update(sessions, events, orders)
+        res = acc.analyze()
+        print(f"batch {res['batches']}: n={res['n_users']} lift={res['frequentist']['lift']:.3f} "
+              f"p={res['frequentist']['p']:.4f} P(lift>0)={res['bayesian']['p_lift_greater_than_zero']:.3f}")
+    path = os.path.join(tempfile.gettempdir(), 'online_ckpt.npz')
+    acc.save(path)
+    print(OnlineAccumulator.load(path).guardrail_summary())
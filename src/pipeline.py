@@ -0,0 +1,215 @@
+# src/pipeline.py
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import time
+from contextlib import nullcontext
+import pandas as pd
+from src.profiling import count_rows
+
+def _sha1(*parts) -> str:
+    h = hashlib.sha1()
+    for part in parts:
+        h.update(part if isinstance(part, bytes) else str(part).encode("utf-8"))
+        h.update(b'\0')
+    return h.hexdigest()
+
+# Source of the src package, hashed into every stage key
+_SRC_ROOT = os.path.dirname(os.path.abspath(__file__))
+# abspath -> [size, mtime_ns, sha1]; persisted by StageCache across runs
+_file_hashes = {}
+
+def _hash_file(path: str, block_size: int = 1 << 20) -> str:
+    """
+    SHA-1 of a file's bytes, read in blocks. The digest is reused while the
+    file's (size, mtime_ns) is unchanged, so only new or modified files are read.
+    """
+    st = os.stat(path)
+    abspath = os.path.abspath(path)
+    memo = _file_hashes.get(abspath)
+    if memo is None or memo[:2] != [st.st_size, st.st_mtime_ns]:
+        h = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(block_size), b''):
+                h.update(block)
+        memo = _file_hashes[abspath] = [st.st_size, st.st_mtime_ns, h.hexdigest()]
+    return memo[2]
+
+def file_fingerprint(path: str) -> str:
+    """
+    Content fingerprint of a file or dataset directory: the hash of every
+    file's bytes (and relative path, for directories). Files are only re-read
+    when their size or mtime changed; touching a file does not change the
+    fingerprint, rewriting it with different data does.
+    """
+    entries = []
+    if os.path.isdir(path):
+        for dirpath, _, files in sorted(os.walk(path)):
+            for f in sorted(files):
+                p = os.path.join(dirpath, f)
+                entries.append((os.path.relpath(p, path), _hash_file(p)))
+    elif os.path.exists(path):
+        entries.append(('', _hash_file(path)))
+    else:
+        raise ValueError(f"Input file '{path}' does not exist.")
+    return _sha1(json.dumps(entries))
+
+def _package_fingerprint(root: str = _SRC_ROOT) -> str:
+    """
+    Hash of every .py file under the src package, so a change to any
+    function a stage calls into invalidates the stage.
+    """
+    files = sorted(os.path.join(d, f) for d, _, fs in os.walk(root) for f in fs if f.endswith('.py'))
+    return _sha1(*[(os.path.relpath(f, root), _hash_file(f)) for f in files])
+
+def _code_fingerprint(fn) -> str:
+    try:
+        source = inspect.getsource(fn)
+    except (OSError, TypeError):
+        source = getattr(fn, '__qualname__', repr(fn))
+    return _sha1(source, _package_fingerprint())
+
+class StageCache:
+    """
+    On-disk store of stage artifacts, one pickle per content key.
+
+    Entries older than max_age seconds are removed first, then the least
+    recently used entries until the cache fits in max_bytes. Hits refresh an
+    entry's modification time. The content hashes of input files are kept
+    alongside, keyed by (size, mtime_ns), so unchanged files are not re-read.
+    """
+    def __init__(self, root: str = 'data/stage_cache', max_bytes: int = None, max_age: float = None):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        os.makedirs(root, exist_ok=True)
+        self.file_hashes_path = os.path.join(root, 'file_hashes.json')
+        if os.path.exists(self.file_hashes_path):
+            with open(self.file_hashes_path) as f:
+                _file_hashes.update(json.load(f))
+
+    def save_file_hashes(self):
+        tmp = self.file_hashes_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(_file_hashes, f)
+        os.replace(tmp, self.file_hashes_path)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key + '.pkl')
+
+    def get(self, key: str):
+        """
+        (True, value) for a cached key, else (False, None).
+        """
+        path = self._path(key)
+        if not os.path.exists(path):
+            return False, None
+        with open(path, 'rb') as f:
+            value = pickle.load(f)
+        os.utime(path)
+        return True, value
+
+    def put(self, key: str, value) -> int:
+        path = self._path(key)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        return os.path.getsize(path)
+
+    def evict(self) -> list:
+        """
+        Apply the age and size limits; returns the evicted keys.
+        """
+        entries = []
+        for name in os.listdir(self.root):
+            if name.endswith('.pkl'):
+                st = os.stat(os.path.join(self.root, name))
+                entries.append((st.st_mtime, st.st_size, name[:-4]))
+        entries.sort()
+        evicted = []
+        now = time.time()
+        if self.max_age is not None:
+            evicted += [k for mtime, _, k in entries if now - mtime > self.max_age]
+        kept = [e for e in entries if e[2] not in evicted]
+        total = sum(size for _, size, _ in kept)
+        if self.max_bytes is not None:
+            for _, size, key in kept:
+                if total <= self.max_bytes:
+                    break
+                evicted.append(key)
+                total -= size
+        for key in evicted:
+            os.remove(self._path(key))
+        return evicted
+
+class Pipeline:
+    """
+    Run named stages with declared inputs and outputs, skipping unchanged ones.
+
+    Each stage's key hashes its name, its source code together with the
+    source of the whole src package, its parameters, the fingerprints of its
+    input artifacts and the content of any input files. Artifacts
+    produced by a stage are fingerprinted from that key, so downstream keys
+    never require hashing data. With cache=None every stage runs; a stage
+    run with cache=False always runs and is never stored (e.g. table loads,
+    whose pickle would only duplicate the input files). With a
+    RunProfiler, each stage is recorded as a profiler stage.
+    """
+    def __init__(self, cache: StageCache = None, profiler=None):
+        self.cache = cache
+        self.profiler = profiler
+        self.artifacts = {}
+        self.fingerprints = {}
+        self.records = []
+
+    def run(self, name: str, fn, inputs=(), outputs=(), params: dict = None, files=(), cache: bool = True):
+        """
+        Call fn(*input artifacts, **params) and store its result under `outputs`.
+
+        fn returns one value per declared output (a tuple when there are
+        several). Returns the output values in the same shape.
+        """
+        params = params or {}
+        missing = [i for i in inputs if i not in self.artifacts]
+        if missing:
+            raise ValueError(f"Stage '{name}' needs artifacts {missing} that no earlier stage produced.")
+        store = self.cache if cache else None
+        key = _sha1(name, _code_fingerprint(fn), json.dumps(params, sort_keys=True, default=str),
+                    *[self.fingerprints[i] for i in inputs], *[file_fingerprint(f) for f in files])
+
+        start = time.perf_counter()
+        args = [self.artifacts[i] for i in inputs]
+        with self.profiler.stage(name, rows_in=count_rows(args)) if self.profiler else nullcontext({}) as rec:
+            hit, value = store.get(key) if store is not None else (False, None)
+            size = None
+            if not hit:
+                value = fn(*args, **params)
+                if store is not None:
+                    size = store.put(key, value)
+            rec['rows_out'] = count_rows(value)
+            rec['cache'] = 'hit' if hit else 'miss'
+        values = value if len(outputs) > 1 else (value,)
+        for out, v in zip(outputs, values):
+            self.artifacts[out] = v
+            self.fingerprints[out] = _sha1(key, out)
+        self.records.append({'stage': name, 'status': ('hit' if hit else 'miss') if store is not None else 'off',
+                             'seconds': time.perf_counter() - start, 'bytes': size, 'key': key[:12]})
+        return value
+
+    def report(self) -> pd.DataFrame:
+        """
+        One row per stage run: stage, status (hit/miss/off), seconds, bytes written, key.
+        """
+        return pd.DataFrame(self.records, columns=['stage', 'status', 'seconds', 'bytes', 'key'])
+
+    def close(self) -> list:
+        """
+        Apply cache eviction and save the file hashes once the run is complete.
+        """
+        if self.cache is None:
+            return []
+        self.cache.save_file_hashes()
+        return self.cache.evict()
@@ -0,0 +1,169 @@
+# src/power.py
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from scipy.stats import norm
+from src.assign import assign_users
+from src.simulate import generate_users, simulate_funnel
+from src.ab_testing import per_user_gpv
+from src.analyze import cuped_transform, diff_in_means_crse
+from src.sequential import sequential_p_values
+
+def analytic_power(effect: float, sigma: float, n_users: int, alpha: float = 0.05, rho: float = 0.0,
+                   treat_share: float = 0.5) -> float:
+    """
+    Normal-approximation power of a two-sided difference-in-means test.
+
+    effect and sigma are in outcome units (e.g. GPV per user); rho is the
+    correlation between outcome and CUPED covariate, which scales the variance
+    by (1 - rho^2). A funnel `lift` as used by simulate_experiment is a
+    conversion-probability lift, not an outcome effect; power_grid reports
+    its GPV equivalent ('mean_lift_est') and this power at it ('analytic_power').
+    """
+    n1 = n_users * treat_share
+    n0 = n_users - n1
+    se = sigma * np.sqrt(1 - rho**2) * np.sqrt(1 / n0 + 1 / n1)
+    z = norm.ppf(1 - alpha / 2)
+    return float(norm.cdf(abs(effect) / se - z) + norm.cdf(-abs(effect) / se - z))
+
+def required_sample_size(effect: float, sigma: float, alpha: float = 0.05, power: float = 0.8,
+                         rho: float = 0.0, treat_share: float = 0.5) -> int:
+    """
+    Total users needed to detect `effect` with the given power (fixed horizon).
+    """
+    z = norm.ppf(1 - alpha / 2) + norm.ppf(power)
+    var = sigma**2 * (1 - rho**2)
+    n = z**2 * var / effect**2 / (treat_share * (1 - treat_share))
+    return int(np.ceil(n))
+
+def _analysis_frame(sessions, orders, assignments, users, cuped: bool) -> pd.DataFrame:
+    df = per_user_gpv(sessions, orders, assignments)
+    df['past_7d_gpv'] = df['user_id'].map(users.set_index('user_id')['past_7d_gpv'])
+    y = df['gpv'].values
+    df['y'] = cuped_transform(y, df['past_7d_gpv'].values)[0] if cuped else y
+    return df
+
+def simulate_experiment(n_users: int, lift: float, seed: int, cuped: bool = True, sequential: bool = False,
+                        max_looks: int = 7, alpha: float = 0.05, **funnel_kwargs) -> dict:
+    """
+    One simulated experiment through the production analysis chain.
+
+    simulate_funnel -> per_user_gpv -> cuped_transform -> diff_in_means_crse.
+    With sequential=True each look day re-aggregates GPV from the sessions up
+    to that day, over the users who have entered by then, and the looks are
+    tested against O'Brien-Fleming boundaries. `lift` is the
+    conversion-probability lift passed to simulate_funnel; `lift_est` and
+    `sd` are in GPV units.
+    """
+    users = generate_users(n_users, seed=seed)
+    assignments = assign_users(users, f'power_{seed}', ['control', 'treatment'])
+    users = users.merge(assignments[['user_id', 'variant']], on='user_id')
+    sessions, _, orders, _ = simulate_funnel(users, lift=lift, seed=seed, **funnel_kwargs)
+
+    if not sequential:
+        df = _analysis_frame(sessions, orders, assignments, users, cuped)
+        res = diff_in_means_crse(df, 'y', 'variant', 'user_id')
+        return {'reject': bool(res['p'] < alpha), 'lift_est': res['lift'], 'sd': float(df['y'].std()),
+                'stop_look': np.nan}
+
+    lifts, ses = [], []
+    for day in np.sort(sessions['session_day'].unique())[:max_looks]:
+        # Orders of later sessions find no session row and drop out of per_user_gpv
+        df = _analysis_frame(sessions[sessions['session_day'] <= day], orders, assignments, users, cuped)
+        res = diff_in_means_crse(df, 'y', 'variant', 'user_id')
+        lifts.append(res['lift'])
+        ses.append(res['se'])
+    seq = sequential_p_values(pd.Series(lifts), pd.Series(ses), max_looks, alpha)
+    stops = seq.index[seq['stop']]
+    stop_look = int(seq.loc[stops[0], 'look']) if len(stops) else np.nan
+    return {'reject': bool(len(stops)), 'lift_est': float(seq['lift'].iloc[-1]), 'sd': float(df['y'].std()),
+            'stop_look': stop_look}
+
+# Bump when a cell's result changes for the same parameters, to invalidate cached cells
+CELL_VERSION = 2
+
+def _cell_key(params: dict) -> str:
+    return hashlib.sha1(json.dumps([CELL_VERSION, params], sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def _run_cell(params: dict) -> dict:
+    """
+    All simulations for one (lift, n_users) grid cell.
+    """
+    p = dict(params)
+    n_sims, seed = p.pop('n_sims'), p.pop('seed')
+    sims = [simulate_experiment(seed=seed + i, **p) for i in range(n_sims)]
+    reject = np.array([s['reject'] for s in sims])
+    stop = np.array([s['stop_look'] for s in sims], dtype=float)
+    power = reject.mean()
+    half = 1.96 * np.sqrt(power * (1 - power) / n_sims)
+    # The funnel lift in GPV units, and the outcome sd after CUPED (so rho is already applied)
+    effect = float(np.mean([s['lift_est'] for s in sims]))
+    sigma = float(np.sqrt(np.mean([s['sd'] ** 2 for s in sims])))
+    return {
+        'lift': params['lift'],
+        'n_users': params['n_users'],
+        'n_sims': n_sims,
+        'power': float(power),
+        'power_ci_low': float(max(power - half, 0.0)),
+        'power_ci_high': float(min(power + half, 1.0)),
+        'mean_lift_est': effect,
+        'sigma': sigma,
+        'analytic_power': analytic_power(effect, sigma, params['n_users'], params['alpha']),
+        'mean_stop_look': float(np.nanmean(stop)) if np.isfinite(stop).any() else np.nan,
+    }
+
+def power_grid(lifts: list, sample_sizes: list, n_sims: int = 200, cuped: bool = True, sequential: bool = False,
+               max_looks: int = 7, alpha: float = 0.05, seed: int = 42, n_jobs: int = 1,
+               cache_dir: str = 'data/power_cache', **funnel_kwargs) -> pd.DataFrame:
+    """
+    Simulated power over a grid of lifts x sample sizes.
+
+    Alongside the simulated power each row carries the funnel lift converted
+    to GPV units ('mean_lift_est', the mean estimated effect) and the outcome sd,
+    and 'analytic_power' evaluated at them, so the simulated and analytic
+    curves can be drawn against the same `lift` axis.
+
+    Each grid cell is run on a process pool (n_jobs) and its result is cached
+    as JSON under cache_dir, keyed by a hash of all cell parameters, so
+    re-running or extending a grid only simulates new cells. Pass
+    cache_dir=None to disable caching.
+    """
+    cells = []
+    for lift in lifts:
+        for n_users in sample_sizes:
+            cells.append(dict(lift=float(lift), n_users=int(n_users), n_sims=n_sims, seed=seed, cuped=cuped,
+                              sequential=sequential, max_looks=max_looks, alpha=alpha, **funnel_kwargs))
+
+    results = {}
+    todo = []
+    for cell in cells:
+        path = os.path.join(cache_dir, _cell_key(cell) + '.json') if cache_dir else None
+        if path and os.path.exists(path):
+            with open(path) as f:
+                results[_cell_key(cell)] = json.load(f)
+        else:
+            todo.append(cell)
+
+    if n_jobs > 1 and len(todo) > 1:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            computed = list(pool.map(_run_cell, todo))
+    else:
+        computed = [_run_cell(cell) for cell in todo]
+
+    for cell, res in zip(todo, computed):
+        results[_cell_key(cell)] = res
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(os.path.join(cache_dir, _cell_key(cell) + '.json'), 'w') as f:
+                json.dump(res, f)
+
+    return pd.DataFrame([results[_cell_key(cell)] for cell in cells])
+
+if __name__ == "__main__":
+    # Example usage
+    print("Analytic n for +2 GPV, sd 30, rho 0.5:", required_sample_size(2.0, 30.0, rho=0.5))
+    grid = power_grid([0.0, 0.05], [1000, 4000], n_sims=20, cache_dir=None)
+    print(grid)
@@ -0,0 +1,207 @@
+# src/profiling.py
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+
+_active = None
+
+def _rss_bytes() -> int:
+    """
+    Current resident set size, or the lifetime peak where /proc is unavailable.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+def count_rows(obj):
+    """
+    Row count of a DataFrame/Series/array, summed over tuples, lists and dict values; None if unknown.
+    """
+    if isinstance(obj, (pd.DataFrame, pd.Series, np.ndarray)):
+        return int(len(obj)) if np.ndim(obj) else None
+    if isinstance(obj, (tuple, list)):
+        counts = [count_rows(o) for o in obj]
+    elif isinstance(obj, dict):
+        counts = [count_rows(o) for o in obj.values()]
+    else:
+        return None
+    counts = [c for c in counts if c is not None]
+    return sum(counts) if counts else None
+
+class _PeakSampler:
+    """
+    Background thread sampling RSS to find the peak within one stage.
+    """
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.peak = _rss_bytes()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, _rss_bytes())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _rss_bytes())
+
+class RunProfiler:
+    """
+    Per-stage wall time, CPU time, peak RSS and row counts for one pipeline run.
+
+    Stages are timed with the stage() context manager or the @instrument
+    decorator; nested stages record their parent. CPU time includes waited-for
+    child processes. Stages named in cprofile (or all, with cprofile='all')
+    also run under cProfile; the top functions by cumulative time are kept in
+    the record and the full stats are dumped to prof_dir if given.
+    """
+    def __init__(self, cprofile=(), prof_dir: str = None, sample_interval: float = 0.01, top_n: int = 15):
+        self.cprofile = cprofile
+        self.prof_dir = prof_dir
+        self.sample_interval = sample_interval
+        self.top_n = top_n
+        self.records = []
+        self._stack = []
+        self._samplers = []
+        self.started = time.time()
+
+    def _profiled(self, name: str) -> bool:
+        return self.cprofile == 'all' or name in self.cprofile
+
+    @contextmanager
+    def stage(self, name: str, rows_in=None):
+        """
+        Time the enclosed block; set rec['rows_out'] inside it to record output rows.
+        """
+        rec = {'stage': name, 'parent': self._stack[-1] if self._stack else None, 'depth': len(self._stack),
+               'rows_in': rows_in, 'rows_out': None, 'rss_start_mb': _rss_bytes() / 2**20}
+        self._stack.append(name)
+        prof = cProfile.Profile() if self._profiled(name) else None
+        own, children = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+        wall = time.perf_counter()
+        try:
+            with _PeakSampler(self.sample_interval) as sampler:
+                self._samplers.append(sampler)
+                if prof is not None:
+                    prof.enable()
+                try:
+                    yield rec
+                finally:
+                    if prof is not None:
+                        prof.disable()
+        finally:
+            rec['wall_s'] = time.perf_counter() - wall
+            own2, children2 = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+            rec['cpu_s'] = sum(b.ru_utime + b.ru_stime - a.ru_utime - a.ru_stime
+                               for a, b in ((own, own2), (children, children2)))
+            self._samplers.pop()
+            if self._samplers:
+                # A short spike inside a nested stage may fall between the parent's samples
+                self._samplers[-1].peak = max(self._samplers[-1].peak, sampler.peak)
+            rec['peak_rss_mb'] = sampler.peak / 2**20
+            rec['rss_end_mb'] = _rss_bytes() / 2**20
+            if prof is not None:
+                rec['cprofile_top'] = self._top_functions(prof, name)
+            self._stack.pop()
+            self.records.append(rec)
+
+    def _top_functions(self, prof: cProfile.Profile, name: str) -> list:
+        if self.prof_dir:
+            os.makedirs(self.prof_dir, exist_ok=True)
+            prof.dump_stats(os.path.join(self.prof_dir, f'{name}.prof'))
+        stats = pstats.Stats(prof, stream=io.StringIO())
+        rows = sorted(stats.stats.items(), key=lambda kv: kv[1][3], reverse=True)[:self.top_n]
+        return [{'function': f'{path}:{line}({func})', 'calls': nc, 'tottime_s': tt, 'cumtime_s': ct}
+                for (path, line, func), (_, nc, tt, ct, _) in rows]
+
+    def to_frame(self) -> pd.DataFrame:
+        cols = ['stage', 'parent', 'depth', 'wall_s', 'cpu_s', 'peak_rss_mb', 'rss_start_mb', 'rss_end_mb',
+                'rows_in', 'rows_out']
+        return pd.DataFrame([{c: r.get(c) for c in cols} for r in self.records], columns=cols)
+
+    def write(self, path: str):
+        """
+        Write the run profile as JSON, or as Parquet if path ends in .parquet (cProfile tables are JSON only).
+        """
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        if path.endswith('.parquet'):
+            self.to_frame().to_parquet(path, index=False)
+            return path
+        profile = {'started': self.started, 'argv': sys.argv, 'pid': os.getpid(), 'stages': self.records}
+        with open(path, 'w') as f:
+            json.dump(profile, f, indent=2, default=str)
+        return path
+
+    def activate(self):
+        """
+        Make this the profiler that @instrument-ed functions record into.
+        """
+        global _active
+        self._previous, _active = _active, self
+        return self
+
+    def deactivate(self):
+        global _active
+        _active = self._previous
+
+    def __enter__(self):
+        return self.activate()
+
+    def __exit__(self, *exc):
+        self.deactivate()
+
+def instrument(name: str = None):
+    """
+    Decorator recording a function call as a stage of the active RunProfiler.
+
+    Inputs and outputs are counted with count_rows. Without an active
+    profiler the function runs unchanged.
+    """
+    def decorator(fn):
+        stage_name = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _active is None:
+                return fn(*args, **kwargs)
+            with _active.stage(stage_name, rows_in=count_rows(list(args) + list(kwargs.values()))) as rec:
+                out = fn(*args, **kwargs)
+                rec['rows_out'] = count_rows(out)
+            return out
+        return wrapper
+    return decorator
+
+if __name__ == "__main__":
+    # Example usage
+    @instrument()
+    def build(n):
+        return pd.DataFrame({'x': np.random.rand(n)})
+
+    @instrument()
+    def summarize(df):
+        return df.groupby((df['x'] * 10).astype(int))['x'].agg(['mean', 'count'])
+
+    with RunProfiler(cprofile=['summarize']) as profiler:
+        with profiler.stage('pipeline'):
+            summarize(build(2_000_000))
+    print(profiler.to_frame().to_string(index=False))
+    print(profiler.records[1]['cprofile_top'][:3])
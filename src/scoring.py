@@ -0,0 +1,182 @@
+# src/scoring.py
+import os
+import joblib
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from src.uplift import fit_models
+from src.storage import iter_table, _require_pyarrow
+from src.profiling import instrument
+
+LEARNERS = ['t', 'x']
+
+_worker_model = None
+
+class FeatureEncoder:
+    """
+    Fixed one-hot encoding of user features, learned once and reused for scoring.
+
+    Produces the same columns as pd.get_dummies(drop_first=True) on the
+    training frame, but levels are frozen at fit time so any later chunk maps
+    to the same matrix layout. Unseen or missing levels encode as all zeros.
+    """
+    def __init__(self, numeric_cols: list, categorical_cols: list, drop_first: bool = True):
+        self.numeric_cols = list(numeric_cols)
+        self.categorical_cols = list(categorical_cols)
+        self.drop_first = drop_first
+        self.levels = {}
+
+    @property
+    def input_cols(self) -> list:
+        return self.numeric_cols + self.categorical_cols
+
+    @property
+    def feature_names(self) -> list:
+        names = list(self.numeric_cols)
+        for col in self.categorical_cols:
+            levels = self.levels[col][1:] if self.drop_first else self.levels[col]
+            names += [f'{col}_{lvl}' for lvl in levels]
+        return names
+
+    def fit(self, df: pd.DataFrame):
+        for col in self.categorical_cols:
+            self.levels[col] = sorted(df[col].dropna().astype(str).unique())
+        return self
+
+    def transform(self, df: pd.DataFrame) -> np.ndarray:
+        """
+        Encoded feature matrix (rows x len(feature_names)), float64.
+        """
+        if not self.levels and self.categorical_cols:
+            raise ValueError("FeatureEncoder must be fitted before transform.")
+        X = np.zeros((len(df), len(self.feature_names)))
+        X[:, :len(self.numeric_cols)] = df[self.numeric_cols].to_numpy(dtype=float)
+        offset = len(self.numeric_cols)
+        rows = np.arange(len(df))
+        for col in self.categorical_cols:
+            levels = self.levels[col]
+            codes = pd.Categorical(df[col].astype(str), categories=levels).codes
+            if self.drop_first:
+                codes = codes - 1
+            hit = codes >= 0
+            X[rows[hit], offset + codes[hit]] = 1.0
+            offset += len(levels) - int(self.drop_first)
+        return X
+
+    def transform_frame(self, df: pd.DataFrame) -> pd.DataFrame:
+        return pd.DataFrame(self.transform(df), columns=self.feature_names, index=df.index)
+
+class UpliftModel:
+    """
+    Persistable T-/X-learner: a FeatureEncoder plus control, treatment and
+    propensity models fitted on all training users, and for the X-learner the
+    per-arm models of effects imputed with the other arm's outcome model.
+    """
+    def __init__(self, encoder: FeatureEncoder, learner: str = 'x', backend: str = 'gb',
+                 model_params: dict = None, random_state=42):
+        if learner not in LEARNERS:
+            raise ValueError(f"Unknown learner '{learner}'. Use one of {LEARNERS}.")
+        self.encoder = encoder
+        self.learner = learner
+        self.backend = backend
+        self.params = dict(random_state=random_state, **(model_params or {}))
+        self.models = None
+
+    def fit(self, df: pd.DataFrame, outcome_col: str, treat_col: str, n_jobs: int = 1):
+        X = self.encoder.transform(df)
+        y = df[outcome_col].to_numpy(dtype=float)
+        t = df[treat_col].to_numpy().astype(int)
+        specs = [('regressor', self.backend, self.params, X[t == 0], y[t == 0]),
+                 ('regressor', self.backend, self.params, X[t == 1], y[t == 1]),
+                 ('classifier', self.backend, self.params, X, t)]
+        self.models = dict(zip(['control', 'treatment', 'propensity'], fit_models(specs, n_jobs)))
+        if self.learner == 'x':
+            d = np.where(t == 1, y - self.models['control'].predict(X), self.models['treatment'].predict(X) - y)
+            specs = [('regressor', self.backend, self.params, X[t == 0], d[t == 0]),
+                     ('regressor', self.backend, self.params, X[t == 1], d[t == 1])]
+            self.models.update(zip(['tau_control', 'tau_treatment'], fit_models(specs, n_jobs)))
+        return self
+
+    def predict(self, df: pd.DataFrame) -> np.ndarray:
+        """
+        CATE for each row of a frame holding the encoder's input columns.
+        """
+        if self.models is None:
+            raise ValueError("UpliftModel must be fitted before predict.")
+        X = self.encoder.transform(df)
+        if self.learner == 't':
+            return self.models['treatment'].predict(X) - self.models['control'].predict(X)
+        e = self.models['propensity'].predict_proba(X)[:, 1]
+        return e * self.models['tau_control'].predict(X) + (1 - e) * self.models['tau_treatment'].predict(X)
+
+    def save(self, path: str):
+        tmp = path + '.tmp'
+        joblib.dump(self, tmp)
+        os.replace(tmp, path)
+        return path
+
+    @staticmethod
+    def load(path: str):
+        return joblib.load(path)
+
+def _init_worker(model):
+    global _worker_model
+    _worker_model = model
+
+def _score_chunk(chunk: pd.DataFrame, model=None) -> pd.DataFrame:
+    model = _worker_model if model is None else model
+    return pd.DataFrame({'user_id': chunk['user_id'].to_numpy(), 'cate': model.predict(chunk)})
+
+@instrument()
+def score_users(model, out_path: str, root: str = 'data', fmt: str = 'parquet', chunk_size: int = 500_000,
+                n_jobs: int = 1) -> int:
+    """
+    Stream the users table in chunks, score each chunk and append it to a Parquet file.
+
+    `model` is an UpliftModel or a path saved by UpliftModel.save. With
+    n_jobs > 1 chunks are scored on a process pool holding one copy of the
+    model per worker; at most 2 * n_jobs chunks are in flight, so memory is
+    bounded by chunk_size rather than the table size. Returns the rows scored.
+    """
+    pa = _require_pyarrow()
+    model = UpliftModel.load(model) if isinstance(model, str) else model
+    chunks = iter_table('users', root, fmt, columns=['user_id'] + model.encoder.input_cols, chunk_size=chunk_size)
+    schema = pa.schema([('user_id', pa.string()), ('cate', pa.float64())])
+    tmp = out_path + '.tmp'
+    n_rows = 0
+    with pa.parquet.ParquetWriter(tmp, schema) as writer:
+        def write(scored):
+            writer.write_table(pa.Table.from_pandas(scored.astype({'user_id': str}), schema=schema, preserve_index=False))
+            return len(scored)
+
+        if n_jobs > 1:
+            with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(model,)) as pool:
+                pending = []
+                for chunk in chunks:
+                    pending.append(pool.submit(_score_chunk, chunk))
+                    if len(pending) >= 2 * n_jobs:
+                        n_rows += write(pending.pop(0).result())
+                for fut in pending:
+                    n_rows += write(fut.result())
+        else:
+            for chunk in chunks:
+                n_rows += write(_score_chunk(chunk, model))
+    os.replace(tmp, out_path)
+    return n_rows
+
+if __name__ == "__main__":
+    # Example usage
+    import tempfile
+    from src.simulate import generate_users
+    from src.storage import write_table
+    root = tempfile.mkdtemp()
+    users = generate_users(20000, seed=0)
+    users['treat'] = np.random.randint(0, 2, len(users))
+    users['gpv'] = users['past_7d_gpv'] * 0.3 + 5 * users['treat'] * (users['device'] == 'mobile') + np.random.normal(0, 5, len(users))
+    encoder = FeatureEncoder(['past_7d_gpv'], ['country', 'device', 'traffic_source']).fit(users)
+    path = UpliftModel(encoder, learner='t').fit(users, 'gpv', 'treat').save(os.path.join(root, 'uplift_model.joblib'))
+    os.makedirs(os.path.join(root, 'parquet'))
+    write_table(users, 'users', root, fmt='parquet')
+    n = score_users(path, os.path.join(root, 'scores.parquet'), root=root, chunk_size=5000, n_jobs=2)
+    print(n, "users scored:")
+    print(pd.read_parquet(os.path.join(root, 'scores.parquet')).describe())
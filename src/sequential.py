@@ -2,7 +2,8 @@
 import numpy as np
 import pandas as pd
 from scipy.stats import norm
-from src.analyze import diff_in_means_crse
+from src.analyze import diff_in_means_crse, _treat_indicator
+from src.profiling import instrument
 
 def o_brien_fleming_alpha(t, max_looks, alpha=0.05):
     """
@@ -28,10 +29,101 @@ def sequential_p_values(lift_series: pd.Series, se_series: pd.Series, max_looks:
                         'alpha_boundary': alpha_boundary, 'stop': stop})
     return pd.DataFrame(results)
 
+class SequentialMonitor:
+    """
+    Running cluster-robust difference-in-means for sequential looks.
+
+    Keeps per-cluster (sum1, sum0, n1, n0) plus their 4x4 Gram matrix, so the
+    cluster-robust SE of diff_in_means_from_aggregates can be read off at any
+    look. Folding in a batch costs time proportional to that batch's rows.
+    """
+    def __init__(self, max_looks: int = 14, alpha: float = 0.05):
+        self.max_looks = max_looks
+        self.alpha = alpha
+        self.cluster_idx = {}
+        self.z = np.zeros((1024, 4))  # per cluster: sum1, sum0, n1, n0
+        self.gram = np.zeros((4, 4))
+        self.totals = np.zeros(4)
+        self.shift = None
+        self.lifts = []
+        self.ses = []
+
+    def update(self, y: np.ndarray, treat: np.ndarray, clusters):
+        """
+        Fold in one batch of rows (outcome, 0/1 treatment, cluster id).
+        """
+        y = np.asarray(y, dtype=float)
+        d = np.asarray(treat).astype(bool)
+        keep = ~np.isnan(y)
+        y, d, clusters = y[keep], d[keep], np.asarray(clusters)[keep]
+        if len(y) == 0:
+            return
+        # Lift and SE are invariant to shifting y; centring keeps the Gram matrix well conditioned
+        if self.shift is None:
+            self.shift = float(y.mean())
+        y = y - self.shift
+
+        local, uniques = pd.factorize(clusters)
+        idx = np.fromiter((self.cluster_idx.setdefault(c, len(self.cluster_idx)) for c in uniques),
+                          dtype=np.int64, count=len(uniques))
+        if len(self.cluster_idx) > len(self.z):
+            grown = np.zeros((max(2 * len(self.z), len(self.cluster_idx)), 4))
+            grown[:len(self.z)] = self.z
+            self.z = grown
+
+        k = len(uniques)
+        delta = np.column_stack([
+            np.bincount(local, weights=np.where(d, y, 0.0), minlength=k),
+            np.bincount(local, weights=np.where(d, 0.0, y), minlength=k),
+            np.bincount(local, weights=d, minlength=k),
+            np.bincount(local, weights=~d, minlength=k),
+        ])
+        old = self.z[idx]
+        new = old + delta
+        self.gram += new.T @ new - old.T @ old
+        self.z[idx] = new
+        self.totals += delta.sum(axis=0)
+
+    def current(self) -> dict:
+        """
+        Lift and cluster-robust SE over all rows folded in so far.
+        """
+        S1, S0, N1, N0 = self.totals
+        m1, m0 = S1 / N1, S0 / N0
+        G = len(self.cluster_idx)
+        N = N0 + N1
+        # Cluster influence is c . (sum1, sum0, n1, n0); sum of squares is c' Gram c
+        c = np.array([1 / N1, -1 / N0, -m1 / N1, m0 / N0])
+        ss = max(float(c @ self.gram @ c), 0.0)
+        se = np.sqrt(G / (G - 1) * (N - 1) / (N - 2) * ss) if G > 1 else float('nan')
+        return {'lift': float(m1 - m0), 'se': float(se)}
+
+    def add_look(self, y: np.ndarray, treat: np.ndarray, clusters) -> dict:
+        """
+        Fold in the rows for the next look and record its lift/SE.
+        """
+        if len(self.lifts) >= self.max_looks:
+            raise ValueError("Current look exceeds max looks")
+        self.update(y, treat, clusters)
+        res = self.current()
+        self.lifts.append(res['lift'])
+        self.ses.append(res['se'])
+        return res
+
+    def results(self) -> pd.DataFrame:
+        """
+        O'Brien-Fleming table for all looks recorded so far.
+        """
+        return sequential_p_values(pd.Series(self.lifts), pd.Series(self.ses), self.max_looks, self.alpha)
+
+@instrument()
 def sequential_monitoring(df: pd.DataFrame, outcome_col: str, treat_col: str, cluster_col: str,
-                          max_looks: int = 14, alpha: float = 0.05):
+                          max_looks: int = 14, alpha: float = 0.05, incremental: bool = True):
     """
     Perform sequential monitoring using cluster-robust SE.
+
+    With incremental=True each day's rows are folded into a SequentialMonitor
+    once; otherwise every look refits on the cumulative frame.
     """
     lift_list = []
     se_list = []
@@ -45,6 +137,22 @@ def sequential_monitoring(df: pd.DataFrame, outcome_col: str, treat_col: str, cl
     if len(days) < max_looks:
         print(f"Warning: Number of unique days ({len(days)}) is less than max_looks ({max_looks}). Using available days.")
     
+    if incremental:
+        n_looks = min(max_looks, len(days))
+        df2 = df.dropna(subset=[outcome_col, treat_col])
+        day_codes = np.searchsorted(days, df2['day'].values)
+        order = np.argsort(day_codes, kind='stable')
+        bounds = np.searchsorted(day_codes[order], np.arange(n_looks + 1))
+        y = df2[outcome_col].values[order]
+        d = _treat_indicator(df2[treat_col])[order]
+        clusters = df2[cluster_col].values[order]
+
+        monitor = SequentialMonitor(max_looks, alpha)
+        for look in range(n_looks):
+            rows = slice(bounds[look], bounds[look + 1])
+            monitor.add_look(y[rows], d[rows], clusters[rows])
+        return monitor.results()
+
     for look in range(1, min(max_looks + 1, len(days) + 1)):
         sub_df = df[df['day'] <= days[look-1]]
         res = diff_in_means_crse(sub_df, outcome_col, treat_col, cluster_col)
@@ -2,6 +2,9 @@
 import numpy as np
 import pandas as pd
 
+# Funnel steps in the order they are logged within a session
+FUNNEL_EVENTS = ['view_page', 'add_to_cart', 'view_cart', 'add_payment', 'place_order', 'refund', 'support_ticket']
+
 def generate_users(n_users=1000, seed=42):
     """
     Generate synthetic users with features.
@@ -16,85 +19,110 @@ def generate_users(n_users=1000, seed=42):
     })
     return users
 
+def _simulate_chunk(users: pd.DataFrame, lift, heterogeneity, noncompliance):
+    """
+    Simulate the funnel for a block of users with array-level draws.
+    """
+    n_users = len(users)
+    user_ids = users['user_id'].astype(str).values
+    treated = (users['variant'] == 'treatment').values
+
+    # Heterogeneous lift by device/country
+    user_lift = np.full(n_users, lift, dtype=float)
+    if heterogeneity:
+        user_lift[(users['device'] == 'mobile').values] *= 1.5
+        user_lift[(users['country'] == 'IN').values] *= 0.8
+
+    # Random noncompliance flips assignment
+    treated = treated ^ (np.random.rand(n_users) < noncompliance)
+
+    # Sessions (1-3 per user), expanded to one row per session
+    n_sess = np.random.randint(1, 4, n_users)
+    user_idx = np.repeat(np.arange(n_users), n_sess)
+    n_total = len(user_idx)
+    sess_num = np.arange(n_total) - np.repeat(np.cumsum(n_sess) - n_sess, n_sess)
+
+    sess_user = user_ids[user_idx]
+    sess_treated = treated[user_idx]
+    session_id = pd.Series(sess_user).str.cat(pd.Series(sess_num).astype(str), sep='_s').values
+    variant = np.where(sess_treated, 'treatment', 'control')
+    session_day = np.random.randint(1, 8, n_total) # 7 day experiment
+
+    # Conversion based on variant & lift
+    conversion_prob = 0.10 + np.where(sess_treated, user_lift[user_idx], 0.0)
+    placed_order = np.random.rand(n_total) < conversion_prob
+
+    # Treated converters see the faster checkout
+    z = np.random.standard_normal(n_total)
+    latency = np.where(placed_order & sess_treated, 150 + 15 * z, 160 + 20 * z)
+
+    # Event indicator matrix, one column per entry in FUNNEL_EVENTS
+    u = np.random.rand(n_total, 5)
+    steps = np.column_stack([
+        np.ones(n_total, dtype=bool),
+        u[:, 0] < 0.9,
+        u[:, 1] < 0.85,
+        u[:, 2] < 0.8,
+        placed_order,
+        placed_order & (u[:, 3] < 0.05),
+        u[:, 4] < 0.02,
+    ])
+    ev_sess, ev_step = np.nonzero(steps)
+
+    n_orders = int(placed_order.sum())
+    order_sess = session_id[placed_order]
+
+    sessions_df = pd.DataFrame({'session_id': session_id, 'user_id': sess_user, 'variant': variant, 'session_day': session_day})
+    events_df = pd.DataFrame({'session_id': session_id[ev_sess], 'user_id': sess_user[ev_sess],
+                              'name': np.asarray(FUNNEL_EVENTS, dtype=object)[ev_step]})
+    orders_df = pd.DataFrame({
+        'order_id': pd.Series(order_sess, dtype=object).add('_o1').values,
+        'session_id': order_sess,
+        'revenue': np.random.normal(100, 10, n_orders),
+        'discount': np.random.normal(5, 2, n_orders),
+        'var_cost': np.random.normal(20, 5, n_orders)
+    })
+    perf_df = pd.DataFrame({'session_id': session_id, 'checkout_latency_ms': latency})
+    return sessions_df, events_df, orders_df, perf_df
+
+def simulate_funnel_chunks(users: pd.DataFrame, lift=0.025, heterogeneity=True, noncompliance=0.05,
+                           logging_loss=0.02, seed=42, chunk_size=100_000):
+    """
+    Generator form of simulate_funnel.
+
+    Yields a (sessions, events, orders, perf) tuple per block of `chunk_size`
+    users, so callers can write each block out without holding the full tables.
+    """
+    np.random.seed(seed)
+    for start in range(0, len(users), chunk_size):
+        yield _simulate_chunk(users.iloc[start:start + chunk_size], lift, heterogeneity, noncompliance)
+
 def simulate_funnel(users: pd.DataFrame, lift=0.025, heterogeneity=True, noncompliance=0.05,
-                    logging_loss=0.02, seed=42):
+                    logging_loss=0.02, seed=42, chunk_size=100_000):
     """
     Simulate funnel for control/treatment with optional heterogeneity and noise.
+
+    Users are processed in blocks of `chunk_size` with all draws made as arrays,
+    so peak memory is bounded by the block rather than the user count. Output is
+    reproducible for a given `seed` and `chunk_size`.
     """
-    np.random.seed(seed)
-    sessions = []
-    events = []
-    orders = []
-    perf = []
-    
-    for _, user in users.iterrows():
-        # Use the pre-assigned variant from the input DataFrame
-        variant = user['variant']
-        user_lift = lift
-        if heterogeneity:
-            # Heterogeneous lift by device/country
-            if user['device']=='mobile':
-                user_lift *= 1.5
-            if user['country']=='IN':
-                user_lift *= 0.8
-        
-        if np.random.rand() < noncompliance:
-            # Random noncompliance flips assignment
-            variant = 'control' if variant=='treatment' else 'treatment'
-
-        # Simulate sessions (1-3 per user)
-        n_sess = np.random.randint(1,4)
-        for s in range(n_sess):
-            session_id = f"{user['user_id']}_s{s}"
-            session_day = np.random.randint(1,8) # 7 day experiment
-            sessions.append({'session_id': session_id, 'user_id': user['user_id'], 'variant': variant, 'session_day': session_day})
-            
-            # Simulate conversion based on variant & lift
-            conversion_prob = 0.10 + (user_lift if variant=='treatment' else 0)
-            placed_order = np.random.rand() < conversion_prob
-            
-            if placed_order:
-                perf.append({'session_id': session_id, 'checkout_latency_ms': np.random.normal(160,20) if variant=='control' else np.random.normal(150,15)})
-            else:
-                perf.append({'session_id': session_id, 'checkout_latency_ms': np.random.normal(160,20)})
-            
-            # Simulate events
-            events.append({'session_id': session_id, 'user_id': user['user_id'], 'name':'view_page'})
-            if np.random.rand() < 0.9:
-                events.append({'session_id': session_id, 'user_id': user['user_id'], 'name':'add_to_cart'})
-            if np.random.rand() < 0.85:
-                events.append({'session_id': session_id, 'user_id': user['user_id'], 'name':'view_cart'})
-            if np.random.rand() < 0.8:
-                events.append({'session_id': session_id, 'user_id': user['user_id'], 'name':'add_payment'})
-
-            if placed_order:
-                events.append({'session_id': session_id, 'user_id': user['user_id'], 'name':'place_order'})
-                orders.append({
-                    'order_id': f"{session_id}_o1",
-                    'session_id': session_id,
-                    'revenue': np.random.normal(100,10),
-                    'discount': np.random.normal(5,2),
-                    'var_cost': np.random.normal(20,5)
-                })
-                if np.random.rand() < 0.05:
-                    events.append({'session_id': session_id, 'user_id': user['user_id'], 'name':'refund'})
-            
-            if np.random.rand() < 0.02:
-                events.append({'session_id': session_id, 'user_id': user['user_id'], 'name':'support_ticket'})
-    
-    sessions_df = pd.DataFrame(sessions)
-    events_df = pd.DataFrame(events)
-    orders_df = pd.DataFrame(orders)
-    perf_df = pd.DataFrame(perf)
-    
+    tables = ([], [], [], [])
+    for chunk in simulate_funnel_chunks(users, lift, heterogeneity, noncompliance, logging_loss, seed, chunk_size):
+        for acc, part in zip(tables, chunk):
+            acc.append(part)
+
+    if not tables[0]:
+        return _simulate_chunk(users.iloc[:0], lift, heterogeneity, noncompliance)
+    sessions_df, events_df, orders_df, perf_df = (pd.concat(t, ignore_index=True) for t in tables)
     return sessions_df, events_df, orders_df, perf_df
 
 if __name__ == "__main__":
     users = generate_users()
+    users['variant'] = np.random.choice(['control','treatment'], len(users))
     sessions, events, orders, perf = simulate_funnel(users, lift=0.05)
     
     print("Simulated tables:")
     print("Sessions:", sessions.shape)
     print("Events:", events.shape)
     print("Orders:", orders.shape)
-    print("Perf:", perf.shape)
\ No newline at end of file
+    print("Perf:", perf.shape)
@@ -0,0 +1,97 @@
+# src/sketch.py
+import numpy as np
+
+class TDigest:
+    """
+    Mergeable quantile sketch (merging t-digest with the arcsine scale function).
+
+    Values are summarised by at most ~compression/2 weighted centroids, with
+    small centroids in the tails so extreme quantiles stay accurate. Digests
+    built on different partitions can be merged and queried without the raw
+    values.
+    """
+    def __init__(self, compression: float = 200):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.min = np.inf
+        self.max = -np.inf
+
+    @property
+    def n(self) -> float:
+        return float(self.weights.sum())
+
+    def _compress(self, means: np.ndarray, weights: np.ndarray):
+        order = np.argsort(means, kind='stable')
+        means, weights = means[order], weights[order]
+        cum = np.cumsum(weights)
+        q_mid = (cum - weights / 2) / cum[-1]
+        # One centroid per unit of k(q) = delta / (2 pi) * asin(2q - 1)
+        k = self.compression / (2 * np.pi) * np.arcsin(2 * q_mid - 1)
+        groups = np.floor(k - k[0]).astype(np.int64)
+        _, groups = np.unique(groups, return_inverse=True)
+        w = np.bincount(groups, weights=weights)
+        self.means = np.bincount(groups, weights=means * weights) / w
+        self.weights = w
+
+    def update(self, values):
+        """
+        Add a batch of values (NaNs are ignored).
+        """
+        values = np.asarray(values, dtype=float).ravel()
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return self
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self._compress(np.concatenate([self.means, values]),
+                       np.concatenate([self.weights, np.ones(len(values))]))
+        return self
+
+    def merge(self, other: 'TDigest'):
+        """
+        Fold another digest into this one.
+        """
+        if len(other.weights) == 0:
+            return self
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress(np.concatenate([self.means, other.means]),
+                       np.concatenate([self.weights, other.weights]))
+        return self
+
+    def quantile(self, q):
+        """
+        Approximate quantile(s) q in [0, 1], interpolating between centroid midpoints.
+        """
+        if len(self.weights) == 0:
+            return np.full(np.shape(q), np.nan) if np.ndim(q) else np.nan
+        cum = np.cumsum(self.weights)
+        mid = cum - self.weights / 2
+        x = np.concatenate([[0.0], mid, [cum[-1]]])
+        y = np.concatenate([[self.min], self.means, [self.max]])
+        res = np.interp(np.asarray(q, dtype=float) * cum[-1], x, y)
+        return res if np.ndim(q) else float(res)
+
+    def to_arrays(self) -> dict:
+        return {'means': self.means, 'weights': self.weights, 'min': self.min, 'max': self.max,
+                'compression': self.compression}
+
+    @classmethod
+    def from_arrays(cls, state: dict):
+        digest = cls(float(state['compression']))
+        digest.means = np.asarray(state['means'], dtype=float)
+        digest.weights = np.asarray(state['weights'], dtype=float)
+        digest.min, digest.max = float(state['min']), float(state['max'])
+        return digest
+
+if __name__ == "__main__":
+    # Example usage
+    rng = np.random.default_rng(0)
+    parts = [rng.lognormal(5, 0.5, 100_000) for _ in range(10)]
+    digest = TDigest()
+    for part in parts:
+        digest.merge(TDigest().update(part))
+    q = [0.5, 0.95, 0.99]
+    print("Sketch:", digest.quantile(q), "centroids:", len(digest.weights))
+    print("Exact: ", np.quantile(np.concatenate(parts), q))
@@ -0,0 +1,182 @@
+# src/storage.py
+import os
+import shutil
+import pandas as pd
+from src.profiling import instrument
+
+# Simulated tables are partitioned by the day and arm of the session they belong to
+PARTITION_COLS = ['session_day', 'variant']
+FUNNEL_TABLES = ['sessions', 'events', 'orders', 'perf']
+
+# Column types of the tables written by scripts/generate_data.py and
+# scripts/run_ab_test.py. These are not the sql/create_tables.sql layout: user
+# attributes live in 'users' rather than on sessions, every funnel table carries
+# the partition columns, and the DDL's ts/event_id/perf_id columns are not
+# simulated. Shared columns use its types: VARCHAR ids map to 'id' (see ID_DTYPES),
+# low-cardinality VARCHARs to categoricals, FLOAT to float64.
+SCHEMAS = {
+    'users': {'user_id': 'id', 'country': 'category', 'device': 'category',
+              'traffic_source': 'category', 'past_7d_gpv': 'float64'},
+    'assignments': {'user_id': 'id', 'variant': 'category', 'bucket_ts': 'datetime64[ns]',
+                    'strata': 'category', 'exp_id': 'category'},
+    'sessions': {'session_id': 'id', 'user_id': 'id', 'variant': 'category', 'session_day': 'int16'},
+    'events': {'session_id': 'id', 'user_id': 'id', 'name': 'category',
+               'session_day': 'int16', 'variant': 'category'},
+    'orders': {'order_id': 'id', 'session_id': 'id', 'revenue': 'float64', 'discount': 'float64',
+               'var_cost': 'float64', 'session_day': 'int16', 'variant': 'category'},
+    'perf': {'session_id': 'id', 'checkout_latency_ms': 'float64',
+             'session_day': 'int16', 'variant': 'category'},
+}
+
+# 'string' keeps ids as Arrow-backed strings; 'category' integer-codes them
+ID_DTYPES = {'string': pd.StringDtype('pyarrow'), 'category': 'category'}
+
+FORMATS = ['csv', 'parquet', 'feather']
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.feather
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("pyarrow is required for Parquet/Feather tables. Install it with 'pip install pyarrow'.") from e
+    return pyarrow
+
+def table_dtypes(name: str, id_dtype: str = 'string') -> dict:
+    """
+    Pandas dtypes for a pipeline table.
+    """
+    if name not in SCHEMAS:
+        raise ValueError(f"Unknown table '{name}'. Expected one of {list(SCHEMAS)}.")
+    if id_dtype not in ID_DTYPES:
+        raise ValueError(f"Unknown id_dtype '{id_dtype}'. Use 'string' or 'category'.")
+    return {col: ID_DTYPES[id_dtype] if t == 'id' else t for col, t in SCHEMAS[name].items()}
+
+def apply_schema(df: pd.DataFrame, name: str, id_dtype: str = 'string') -> pd.DataFrame:
+    """
+    Cast the columns of `df` that belong to table `name` to their schema dtypes.
+    """
+    dtypes = table_dtypes(name, id_dtype)
+    casts = {col: t for col, t in dtypes.items() if col in df.columns and df[col].dtype != t}
+    return df.astype(casts) if casts else df
+
+def table_path(name: str, root: str = 'data', fmt: str = 'csv') -> str:
+    """
+    Location of a table on disk. Parquet tables are dataset directories.
+    """
+    if fmt == 'parquet':
+        return os.path.join(root, 'parquet', name)
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format '{fmt}'. Use one of {FORMATS}.")
+    return os.path.join(root, f'{name}.{fmt}')
+
+def write_table(df: pd.DataFrame, name: str, root: str = 'data', fmt: str = 'csv'):
+    """
+    Write a pipeline table in its schema dtypes, replacing any existing copy.
+    """
+    path = table_path(name, root, fmt)
+    if fmt == 'csv':
+        df.to_csv(path, index=False)
+        return path
+
+    pa = _require_pyarrow()
+    table = pa.Table.from_pandas(apply_schema(df, name), preserve_index=False)
+    if fmt == 'parquet':
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+        pa.parquet.write_table(table, os.path.join(path, 'part-00000-0.parquet'))
+    else:
+        pa.feather.write_feather(table, path)
+    return path
+
+@instrument()
+def read_table(name: str, root: str = 'data', fmt: str = 'csv', columns: list = None,
+               filters=None, id_dtype: str = 'string', memory_map: bool = True) -> pd.DataFrame:
+    """
+    Read a pipeline table with typed columns.
+
+    `columns` limits the columns decoded. For Parquet, `filters` are pushed down
+    to partitions/row groups. Parquet and Feather files are memory-mapped.
+    """
+    path = table_path(name, root, fmt)
+    if fmt == 'csv':
+        dtypes = table_dtypes(name, id_dtype)
+        parse_dates = [c for c, t in dtypes.items() if t == 'datetime64[ns]' and (columns is None or c in columns)]
+        read_dtypes = {c: t for c, t in dtypes.items() if c not in parse_dates}
+        return pd.read_csv(path, usecols=columns, dtype=read_dtypes, parse_dates=parse_dates)
+
+    pa = _require_pyarrow()
+    if fmt == 'parquet':
+        table = pa.parquet.read_table(path, columns=columns, filters=filters, memory_map=memory_map)
+    else:
+        table = pa.feather.read_table(path, columns=columns, memory_map=memory_map)
+    # Keep string columns Arrow-backed instead of materialising Python objects
+    df = table.to_pandas(types_mapper={pa.string(): pd.StringDtype('pyarrow'),
+                                       pa.large_string(): pd.StringDtype('pyarrow')}.get)
+    return apply_schema(df, name, id_dtype)
+
+def iter_table(name: str, root: str = 'data', fmt: str = 'csv', columns: list = None,
+               chunk_size: int = 500_000, id_dtype: str = 'string'):
+    """
+    Stream a pipeline table as typed DataFrames of at most chunk_size rows.
+
+    Only one chunk is decoded at a time, so memory stays bounded by chunk_size.
+    """
+    path = table_path(name, root, fmt)
+    if fmt == 'csv':
+        dtypes = {c: t for c, t in table_dtypes(name, id_dtype).items() if t != 'datetime64[ns]'}
+        for chunk in pd.read_csv(path, usecols=columns, dtype=dtypes, chunksize=chunk_size):
+            yield chunk
+        return
+
+    pa = _require_pyarrow()
+    import pyarrow.dataset as ds
+    dataset = ds.dataset(path, format='parquet' if fmt == 'parquet' else 'feather',
+                         partitioning='hive' if fmt == 'parquet' else None)
+    for batch in dataset.to_batches(columns=columns, batch_size=chunk_size):
+        if batch.num_rows:
+            df = batch.to_pandas(types_mapper={pa.string(): pd.StringDtype('pyarrow'),
+                                               pa.large_string(): pd.StringDtype('pyarrow')}.get)
+            yield apply_schema(df, name, id_dtype)
+
+def attach_partition_keys(sessions: pd.DataFrame, table: pd.DataFrame) -> pd.DataFrame:
+    """
+    Add session_day/variant to a session-keyed table so it can be partitioned.
+    """
+    keys = sessions.set_index('session_id')[PARTITION_COLS]
+    return table.join(keys, on='session_id')
+
+def append_partitioned(df: pd.DataFrame, root: str, part: int, partition_cols=PARTITION_COLS):
+    """
+    Append one chunk to a hive-partitioned Parquet dataset under `root`.
+
+    `part` keeps file names unique across chunks so earlier chunks are not overwritten.
+    """
+    pa = _require_pyarrow()
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    pa.parquet.write_to_dataset(table, root, partition_cols=partition_cols,
+                                basename_template=f'part-{part:05d}-{{i}}.parquet',
+                                existing_data_behavior='overwrite_or_ignore')
+
+def write_funnel_dataset(chunks, root: str):
+    """
+    Stream (sessions, events, orders, perf) chunks into one partitioned dataset per table.
+
+    Any existing dataset under `root/<table>` is replaced. Returns row counts per table.
+    """
+    for name in FUNNEL_TABLES:
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+    counts = dict.fromkeys(FUNNEL_TABLES, 0)
+    for part, (sessions, events, orders, perf) in enumerate(chunks):
+        tables = {
+            'sessions': sessions,
+            'events': attach_partition_keys(sessions, events),
+            'orders': attach_partition_keys(sessions, orders),
+            'perf': attach_partition_keys(sessions, perf),
+        }
+        for name, df in tables.items():
+            if not df.empty:
+                append_partitioned(apply_schema(df, name), os.path.join(root, name), part)
+            counts[name] += len(df)
+    return counts
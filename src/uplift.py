@@ -1,72 +1,300 @@
 # src/uplift.py
+import hashlib
+import json
+from collections import OrderedDict
 import numpy as np
 import pandas as pd
-from sklearn.ensemble import GradientBoostingRegressor, GradientBoostingClassifier
-from sklearn.model_selection import train_test_split
+from joblib import Parallel, delayed
+from sklearn.ensemble import (GradientBoostingRegressor, GradientBoostingClassifier,
+                              HistGradientBoostingRegressor, HistGradientBoostingClassifier)
+from sklearn.model_selection import KFold, train_test_split
+from src.profiling import instrument
 
+BACKENDS = {
+    'gb': (GradientBoostingRegressor, GradientBoostingClassifier),
+    'hist': (HistGradientBoostingRegressor, HistGradientBoostingClassifier),
+}
+
+# Fitted models memoized by data fingerprint and hyperparameters
+_MODEL_CACHE = OrderedDict()
+MODEL_CACHE_SIZE = 32
+
+def _fingerprint(task: str, backend: str, params: dict, X: np.ndarray, y: np.ndarray) -> str:
+    h = hashlib.sha1()
+    h.update(json.dumps([task, backend, params], sort_keys=True, default=str).encode("utf-8"))
+    for arr in (X, y):
+        arr = np.ascontiguousarray(arr)
+        h.update(str((arr.shape, arr.dtype)).encode("utf-8"))
+        h.update(arr.data)
+    return h.hexdigest()
+
+def _make_model(task: str, backend: str, params: dict):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}'. Use one of {list(BACKENDS)}.")
+    reg, clf = BACKENDS[backend]
+    return (clf if task == 'classifier' else reg)(**params)
+
+def _fit(task: str, backend: str, params: dict, X: np.ndarray, y: np.ndarray):
+    return _make_model(task, backend, params).fit(X, y)
+
+@instrument()
+def fit_models(specs: list, n_jobs: int = 1) -> list:
+    """
+    Fit (task, backend, params, X, y) specs, reusing memoized models.
+
+    Models not in the cache are fitted concurrently with joblib.
+    """
+    keys = [_fingerprint(*spec) for spec in specs]
+    todo = {}
+    for key, spec in zip(keys, specs):
+        if key not in _MODEL_CACHE and key not in todo:
+            todo[key] = spec
+    fitted = Parallel(n_jobs=n_jobs)(delayed(_fit)(*spec) for spec in todo.values()) if todo else []
+    _MODEL_CACHE.update(zip(todo, fitted))
+    models = []
+    for k in keys:
+        _MODEL_CACHE.move_to_end(k)
+        models.append(_MODEL_CACHE[k])
+    while len(_MODEL_CACHE) > MODEL_CACHE_SIZE:
+        _MODEL_CACHE.popitem(last=False)
+    return models
+
+class UpliftEngine:
+    """
+    Shared base learners for T-, X-, S- and DR-learners on one train/predict split.
+
+    Each base model (control outcome, treatment outcome, propensity, S-learner
+    outcome, X-learner effect models) is fitted at most once, with independent models fitted in parallel,
+    and its predictions are computed once and reused by every meta-learner.
+    Models are also memoized across engines by data fingerprint and
+    hyperparameters. backend='hist' uses HistGradientBoosting.
+    """
+    def __init__(self, df: pd.DataFrame, outcome_col: str, treat_col: str, feature_cols: list,
+                 random_state=42, backend: str = 'gb', model_params: dict = None, n_jobs: int = 1,
+                 test_size: float = 0.3):
+        self.outcome_col = outcome_col
+        self.treat_col = treat_col
+        self.feature_cols = list(feature_cols)
+        self.backend = backend
+        self.random_state = random_state
+        self.params = dict(random_state=random_state, **(model_params or {}))
+        self.n_jobs = n_jobs
+        self.df_train, self.df_pred = train_test_split(df, test_size=test_size, random_state=random_state)
+        self.X_train = self.df_train[self.feature_cols].to_numpy(dtype=float)
+        self.X_pred = self.df_pred[self.feature_cols].to_numpy(dtype=float)
+        self.y_train = self.df_train[outcome_col].to_numpy(dtype=float)
+        self.t_train = self.df_train[treat_col].to_numpy().astype(int)
+        self._models = {}
+        self._preds = {}
+
+    def _specs(self, name: str):
+        c, t = self.t_train == 0, self.t_train == 1
+        if name == 'control':
+            return ('regressor', self.backend, self.params, self.X_train[c], self.y_train[c])
+        if name == 'treatment':
+            return ('regressor', self.backend, self.params, self.X_train[t], self.y_train[t])
+        if name == 'propensity':
+            return ('classifier', self.backend, self.params, self.X_train, self.t_train)
+        if name == 'single':
+            return ('regressor', self.backend, self.params, np.column_stack([self.X_train, self.t_train]), self.y_train)
+        if name in ('tau_control', 'tau_treatment'):
+            # X-learner second stage: effects imputed with the other arm's outcome model
+            rows = t if name == 'tau_treatment' else c
+            return ('regressor', self.backend, self.params, self.X_train[rows], self._imputed_effects()[rows])
+        raise ValueError(f"Unknown base model '{name}'.")
+
+    def fit(self, names=('control', 'treatment', 'propensity')):
+        """
+        Fit the named base models that are not fitted yet, in parallel.
+        """
+        names = [n for n in names if n not in self._models]
+        for name, model in zip(names, fit_models([self._specs(n) for n in names], self.n_jobs)):
+            self._models[name] = model
+        return self
+
+    def predict(self, name: str, split: str = 'pred') -> np.ndarray:
+        """
+        Cached predictions of a base model on the 'train' or 'pred' split.
+        """
+        key = (name, split)
+        if key not in self._preds:
+            self.fit([name])
+            X = self.X_pred if split == 'pred' else self.X_train
+            model = self._models[name]
+            if name == 'propensity':
+                self._preds[key] = model.predict_proba(X)[:, 1]
+            elif name == 'single':
+                self._preds[key] = (model.predict(np.column_stack([X, np.ones(len(X))]))
+                                    - model.predict(np.column_stack([X, np.zeros(len(X))])))
+            else:
+                self._preds[key] = model.predict(X)
+        return self._preds[key]
+
+    def _imputed_effects(self) -> np.ndarray:
+        """
+        y - mu0(x) for treated and mu1(x) - y for control training rows.
+        """
+        mu0, mu1 = self.predict('control', 'train'), self.predict('treatment', 'train')
+        return np.where(self.t_train == 1, self.y_train - mu0, mu1 - self.y_train)
+
+    def _result(self, cate: np.ndarray) -> pd.DataFrame:
+        out = self.df_pred[['user_id']].copy()
+        out['cate'] = cate
+        return out
+
+    def t_learner(self) -> pd.DataFrame:
+        self.fit(['control', 'treatment'])
+        return self._result(self.predict('treatment') - self.predict('control'))
+
+    def x_learner(self) -> pd.DataFrame:
+        """
+        X-learner: imputed effects regressed within each arm, combined with
+        the propensity as e * tau0 + (1 - e) * tau1.
+        """
+        self.fit(['control', 'treatment', 'propensity'])
+        self.fit(['tau_control', 'tau_treatment'])
+        e = self.predict('propensity')
+        return self._result(e * self.predict('tau_control') + (1 - e) * self.predict('tau_treatment'))
+
+    def s_learner(self) -> pd.DataFrame:
+        return self._result(self.predict('single'))
+
+    def dr_learner(self, clip: float = 0.01, n_folds: int = 5, prefer: str = 'processes') -> pd.DataFrame:
+        """
+        DR-learner: regress the doubly-robust pseudo-outcome on the features.
+
+        The nuisances in the pseudo-outcome are cross-fitted over n_folds
+        folds of the training split, so no row is scored by a model fitted on it.
+        """
+        folds = _folds(len(self.X_train), n_folds, self.random_state)
+        mu0, mu1, e = _cross_fit_nuisances(self.X_train, self.y_train, self.t_train, folds, self.backend,
+                                           self.params, self.n_jobs, prefer)
+        pseudo = _dr_pseudo_outcome(self.y_train, self.t_train, mu0, mu1, e, clip)
+        model = fit_models([('regressor', self.backend, self.params, self.X_train, pseudo)], self.n_jobs)[0]
+        return self._result(model.predict(self.X_pred))
+
+def _fit_rows(task: str, backend: str, params: dict, X: np.ndarray, y: np.ndarray, rows: np.ndarray):
+    return _make_model(task, backend, params).fit(X[rows], y[rows])
+
+def _fit_folds(specs: list, n_jobs: int, prefer: str) -> list:
+    """
+    Fit (task, target, rows) specs on shared X in one pool.
+
+    The full arrays are passed to every task: the thread backend shares them
+    directly and the process backend memory-maps them once, read-only, so
+    each task only ships its row indices.
+    """
+    return Parallel(n_jobs=n_jobs, prefer=prefer, max_nbytes='1M', mmap_mode='r')(
+        delayed(_fit_rows)(*spec) for spec in specs)
+
+def _folds(n: int, n_folds: int, random_state) -> list:
+    if n_folds < 2:
+        raise ValueError("n_folds must be at least 2.")
+    return list(KFold(n_folds, shuffle=True, random_state=random_state).split(np.empty((n, 1))))
+
+def _nuisance_specs(X, y, t, train, backend, params) -> list:
+    """
+    Control outcome, treatment outcome and propensity fit specs on the rows `train`.
+    """
+    return [('regressor', backend, params, X, y, train[t[train] == 0]),
+            ('regressor', backend, params, X, y, train[t[train] == 1]),
+            ('classifier', backend, params, X, t, train)]
+
+def _cross_fit_nuisances(X, y, t, folds, backend, params, n_jobs, prefer):
+    """
+    Out-of-fold mu0, mu1 and propensity for every row.
+    """
+    models = _fit_folds([s for train, _ in folds for s in _nuisance_specs(X, y, t, train, backend, params)], n_jobs, prefer)
+    mu0, mu1, e = np.empty(len(X)), np.empty(len(X)), np.empty(len(X))
+    for k, (_, test) in enumerate(folds):
+        m0, m1, mp = models[3 * k: 3 * k + 3]
+        mu0[test], mu1[test], e[test] = m0.predict(X[test]), m1.predict(X[test]), mp.predict_proba(X[test])[:, 1]
+    return mu0, mu1, e
+
+def _dr_pseudo_outcome(y, t, mu0, mu1, e, clip):
+    e = np.clip(e, clip, 1 - clip)
+    return mu1 - mu0 + t * (y - mu1) / e - (1 - t) * (y - mu0) / (1 - e)
+
+@instrument()
+def cross_fit_cate(df: pd.DataFrame, outcome_col: str, treat_col: str, feature_cols: list, n_folds: int = 5,
+                   random_state=42, backend: str = 'gb', model_params: dict = None, n_jobs: int = 1,
+                   prefer: str = 'processes', clip: float = 0.01) -> pd.DataFrame:
+    """
+    Out-of-fold T-, X-, S- and DR-learner CATE for every user by K-fold cross-fitting.
+
+    For each fold the control, treatment, propensity and S-learner models are
+    fitted on the other K-1 folds and score the held-out fold; all K x 4 fits
+    run concurrently. A second round, also concurrent, fits per fold the
+    X-learner's effect models on imputed effects and the DR-learner's
+    regression of the doubly-robust pseudo-outcome built from the out-of-fold
+    nuisances.
+    """
+    params = dict(random_state=random_state, **(model_params or {}))
+    X = df[list(feature_cols)].to_numpy(dtype=float)
+    y = df[outcome_col].to_numpy(dtype=float)
+    t = df[treat_col].to_numpy().astype(int)
+    Xt = np.column_stack([X, t])
+    folds = _folds(len(X), n_folds, random_state)
+
+    specs = []
+    for train, _ in folds:
+        specs += _nuisance_specs(X, y, t, train, backend, params) + [('regressor', backend, params, Xt, y, train)]
+    models = _fit_folds(specs, n_jobs, prefer)
+
+    mu0, mu1, e, cate_s = (np.empty(len(X)) for _ in range(4))
+    imputed = []
+    for k, (train, test) in enumerate(folds):
+        m0, m1, mp, ms = models[4 * k: 4 * k + 4]
+        mu0[test], mu1[test], e[test] = m0.predict(X[test]), m1.predict(X[test]), mp.predict_proba(X[test])[:, 1]
+        cate_s[test] = (ms.predict(np.column_stack([X[test], np.ones(len(test))]))
+                        - ms.predict(np.column_stack([X[test], np.zeros(len(test))])))
+        # Imputed effects on this fold's training rows, from the other arm's outcome model
+        d = np.zeros(len(X))
+        d[train] = np.where(t[train] == 1, y[train] - m0.predict(X[train]), m1.predict(X[train]) - y[train])
+        imputed.append(d)
+
+    pseudo = _dr_pseudo_outcome(y, t, mu0, mu1, e, clip)
+    specs = []
+    for (train, _), d in zip(folds, imputed):
+        specs += [('regressor', backend, params, X, pseudo, train),
+                  ('regressor', backend, params, X, d, train[t[train] == 0]),
+                  ('regressor', backend, params, X, d, train[t[train] == 1])]
+    models = _fit_folds(specs, n_jobs, prefer)
+    cate_dr, cate_x = np.empty(len(X)), np.empty(len(X))
+    for k, (_, test) in enumerate(folds):
+        m_dr, tau0, tau1 = models[3 * k: 3 * k + 3]
+        cate_dr[test] = m_dr.predict(X[test])
+        cate_x[test] = e[test] * tau0.predict(X[test]) + (1 - e[test]) * tau1.predict(X[test])
+
+    out = df[['user_id']].copy()
+    out['cate_t'] = mu1 - mu0
+    out['cate_x'] = cate_x
+    out['cate_s'] = cate_s
+    out['cate_dr'] = cate_dr
+    return out
+
+@instrument()
 def t_learner(df: pd.DataFrame, outcome_col: str, treat_col: str, feature_cols: list, random_state=42):
     """
     T-Learner: separate models for control and treatment to estimate CATE
     """
-    df_train, df_pred = train_test_split(df, test_size=0.3, random_state=random_state)
-    
-    # Split control and treatment
-    control_df = df_train[df_train[treat_col]==0].copy()
-    treatment_df = df_train[df_train[treat_col]==1].copy()
-    
-    # Train models
-    model_c = GradientBoostingRegressor(random_state=random_state)
-    model_c.fit(control_df[feature_cols], control_df[outcome_col])
-    
-    model_t = GradientBoostingRegressor(random_state=random_state)
-    model_t.fit(treatment_df[feature_cols], treatment_df[outcome_col])
-    
-    # Predict on the full prediction set
-    y0_pred = model_c.predict(df_pred[feature_cols])
-    y1_pred = model_t.predict(df_pred[feature_cols])
-    
-    cate = y1_pred - y0_pred
-    df_pred = df_pred.copy()
-    df_pred['cate'] = cate
-    return df_pred[['user_id','cate']]
+    return UpliftEngine(df, outcome_col, treat_col, feature_cols, random_state).t_learner()
 
+@instrument()
 def x_learner(df: pd.DataFrame, outcome_col: str, treat_col: str, feature_cols: list, random_state=42):
     """
     X-Learner: estimate heterogeneous treatment effects (CATE).
     
     This function implements the standard X-Learner approach:
     1. Model the outcome for the control and treatment groups separately.
-    2. Estimate the conditional average treatment effect (CATE) for each user.
+    2. Impute each user's effect with the other group's model (y - mu0 for
+       treated users, mu1 - y for control users) and model it within each group.
     3. Model the propensity score for each user.
-    4. Use the propensity score to combine the two CATE models into a final, weighted estimate.
-    """
-    df_train, df_pred = train_test_split(df, test_size=0.3, random_state=random_state)
+    4. Combine the two effect models as e * tau0 + (1 - e) * tau1.
 
-    # 1. Model the outcome for control and treatment groups
-    control_df = df_train[df_train[treat_col]==0].copy()
-    treatment_df = df_train[df_train[treat_col]==1].copy()
-    
-    model_c = GradientBoostingRegressor(random_state=random_state)
-    model_c.fit(control_df[feature_cols], control_df[outcome_col])
-    
-    model_t = GradientBoostingRegressor(random_state=random_state)
-    model_t.fit(treatment_df[feature_cols], treatment_df[outcome_col])
-
-    # 2. Estimate CATE for each user
-    tau_t = df_train[outcome_col] - model_c.predict(df_train[feature_cols])
-    tau_c = model_t.predict(df_train[feature_cols]) - df_train[outcome_col]
-
-    # 3. Model the propensity score
-    propensity_model = GradientBoostingClassifier(random_state=random_state)
-    propensity_model.fit(df_train[feature_cols], df_train[treat_col])
-    propensity_scores = propensity_model.predict_proba(df_pred[feature_cols])[:, 1]
-    
-    # 4. Use propensity scores to combine the models
-    cate = propensity_scores * model_t.predict(df_pred[feature_cols]) - (1 - propensity_scores) * model_c.predict(df_pred[feature_cols])
-    
-    df_pred = df_pred.copy()
-    df_pred['cate'] = cate
-    return df_pred[['user_id', 'cate']]
+    Outcome models are shared with t_learner through the model cache.
+    """
+    return UpliftEngine(df, outcome_col, treat_col, feature_cols, random_state).x_learner()
 
 def uplift_summary(cate_df: pd.DataFrame, threshold=0.0):
     """